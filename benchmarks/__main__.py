@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Callable
+
+import numpy as np
+
+from benchmarks.scenarios import SCENARIOS, SCENES, rectangle_scene
+from verlet_simple2d.broadphase import Broadphase, SweepAndPrune, UniformGrid
+from verlet_simple2d.stats import StepStats
+
+BROADPHASES: dict[str, Callable[[], Broadphase]] = {
+  'grid': UniformGrid,
+  'sap': SweepAndPrune,
+}
+
+
+def measure(work: Callable[[], None], min_time: float, warmup: int) -> float:
+  # units per second, repeating work until at least min_time seconds passed
+  for _ in range(warmup): work()
+  done = 0
+  start = time.perf_counter()
+  while (elapsed := time.perf_counter() - start) < min_time or done == 0:
+    work()
+    done += 1
+  return done / elapsed
+
+def peak_memory(build: Callable[[], Callable[[], None]], units: int) -> float:
+  # peak traced allocation in MiB while building the scene and running a few units, measured
+  # separately because tracemalloc slows down the timed runs
+  tracemalloc.start()
+  work = build()
+  for _ in range(units): work()
+  _, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  return peak / 2**20
+
+def run(args: argparse.Namespace) -> int:
+  results = []
+  for name in args.scenarios or SCENARIOS:
+    if name not in SCENARIOS: raise SystemExit(f'unknown scenario {name}, choose from {", ".join(SCENARIOS)}')
+    scenario, unit, sizes = SCENARIOS[name]
+    for n in args.sizes or sizes:
+      work = scenario(n, not args.sequential)
+      rate = measure(work, args.min_time, args.warmup)
+      peak = peak_memory(lambda: scenario(n, not args.sequential), 3)
+      results.append({'scenario': name, 'n': n, 'unit': unit, 'rate': rate, 'peak_mib': peak})
+      print(f'{name:>10} n={n:<6} {rate:10.1f} {unit}/s {peak:8.1f} MiB', flush=True)
+
+  report = {
+    'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    'python': platform.python_version(),
+    'numpy': np.__version__,
+    'machine': platform.machine(),
+    'sequential': args.sequential,
+    'results': results,
+  }
+  if args.out:
+    with open(args.out, 'w', encoding='utf-8') as f:
+      json.dump(report, f, indent=2)
+  return 0
+
+def drift(args: argparse.Namespace) -> int:
+  # steps every scene in float64 and float32 side by side and reports how far the float32 bodies end up
+  # from their float64 counterparts, relative to the body radius
+  for name in args.scenarios or SCENES:
+    if name not in SCENES: raise SystemExit(f'unknown scene {name}, choose from {", ".join(SCENES)}')
+    for n in args.sizes:
+      double = SCENES[name](n, not args.sequential, np.float64)
+      single = SCENES[name](n, not args.sequential, np.float32)
+      done = 0
+      for steps in args.steps:
+        double.run(steps - done)
+        single.run(steps - done)
+        done = steps
+        error = np.linalg.norm(single.bodies.location.astype(np.float64) - double.bodies.location, axis=1) / double.bodies.radius
+        print(f'{name:>10} n={n:<6} step={steps:<6} mean={error.mean():10.3g} max={error.max():10.3g} diverged={np.mean(error > 1):6.1%}', flush=True)
+  return 0
+
+def broadphase_time(space, steps: int) -> float:
+  # milliseconds per step spent in the broadphase
+  space.stats = StepStats()
+  space.run(steps)
+  ms = 1000 * space.stats.times['broadphase'] / steps
+  space.stats = None
+  return ms
+
+def broadphases(args: argparse.Namespace) -> int:
+  # broadphase time per step on the rectangle scene, while the lattice falls and once it settled into a pile
+  for n in args.sizes:
+    for name in args.broadphases or BROADPHASES:
+      if name not in BROADPHASES: raise SystemExit(f'unknown broadphase {name}, choose from {", ".join(BROADPHASES)}')
+      space = rectangle_scene(n, True)
+      space.broadphase = BROADPHASES[name]()
+      falling = broadphase_time(space, args.steps)
+      space.run(args.settle)
+      settled = broadphase_time(space, args.steps)
+      print(f'{name:>10} n={n:<6} falling {falling:8.2f} ms/step settled {settled:8.2f} ms/step', flush=True)
+  return 0
+
+def compare(args: argparse.Namespace) -> int:
+  # flags every result slower, or using more memory, than the baseline by more than threshold
+  with open(args.baseline, encoding='utf-8') as f: baseline = json.load(f)
+  with open(args.current, encoding='utf-8') as f: current = json.load(f)
+  base = {(r['scenario'], r['n']): r for r in baseline['results']}
+  regressions = 0
+  for r in current['results']:
+    b = base.get((r['scenario'], r['n']))
+    if b is None: continue
+    speed = r['rate'] / b['rate']
+    memory = r['peak_mib'] / b['peak_mib'] if b['peak_mib'] else 1.0
+    bad = speed < 1 - args.threshold or memory > 1 + args.threshold
+    regressions += bad
+    print(f'{r["scenario"]:>10} n={r["n"]:<6} speed x{speed:5.2f} memory x{memory:5.2f}{"  REGRESSION" if bad else ""}')
+  print(f'{regressions} regression(s)')
+  return 1 if regressions else 0
+
+def main() -> int:
+  parser = argparse.ArgumentParser(prog='python -m benchmarks')
+  sub = parser.add_subparsers(dest='command', required=True)
+
+  p = sub.add_parser('run', help='run scenarios and optionally save the results as json')
+  p.add_argument('scenarios', nargs='*', help=f'any of {", ".join(SCENARIOS)}, defaults to all')
+  p.add_argument('-n', '--sizes', type=int, nargs='+', help='body counts, defaults to each scenario\'s own')
+  p.add_argument('-o', '--out', help='json file to write')
+  p.add_argument('--min-time', type=float, default=1.0, help='seconds to time each size for')
+  p.add_argument('--warmup', type=int, default=3)
+  p.add_argument('--sequential', action='store_true', help='resolve pairs one by one instead of batched')
+  p.set_defaults(func=run)
+
+  p = sub.add_parser('drift', help='how far float32 runs diverge from float64 ones, in body radii')
+  p.add_argument('scenarios', nargs='*', help=f'any of {", ".join(SCENES)}, defaults to all')
+  p.add_argument('-n', '--sizes', type=int, nargs='+', default=[100, 1000])
+  p.add_argument('-s', '--steps', type=int, nargs='+', default=[10, 100, 1000], help='step counts to report at, ascending')
+  p.add_argument('--sequential', action='store_true', help='resolve pairs one by one instead of batched')
+  p.set_defaults(func=drift)
+
+  p = sub.add_parser('broadphase', help='broadphase time per step on a falling and a settled pile')
+  p.add_argument('broadphases', nargs='*', help=f'any of {", ".join(BROADPHASES)}, defaults to all')
+  p.add_argument('-n', '--sizes', type=int, nargs='+', default=[1000, 10000])
+  p.add_argument('-s', '--steps', type=int, default=50, help='steps to time in each state')
+  p.add_argument('--settle', type=int, default=600, help='steps between the two timings')
+  p.set_defaults(func=broadphases)
+
+  p = sub.add_parser('compare', help='compare two json results, exits 1 on regressions')
+  p.add_argument('baseline')
+  p.add_argument('current')
+  p.add_argument('-t', '--threshold', type=float, default=0.1, help='allowed relative slowdown / memory growth')
+  p.set_defaults(func=compare)
+
+  args = parser.parse_args()
+  return args.func(args)
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+from typing import Callable
+
+import numpy as np
+from numpy.typing import NDArray
+
+from verlet_simple2d import DTYPE
+from verlet_simple2d.broadphase import UniformGrid
+from verlet_simple2d.render import Renderer
+from verlet_simple2d.shapes import Circle, CircleBorder, RectangleBorder
+from verlet_simple2d.space import Space
+
+# a scenario builds its scene for n bodies and returns the unit of work that gets timed
+Scenario = Callable[[int, bool], Callable[[], None]]
+RADIUS = 2.0
+
+
+def lattice(n: int, x: float, y: float, spacing: float) -> NDArray[DTYPE]:
+  # n points on a square lattice starting at (x, y), with a little jitter so stacks don't stay perfectly aligned
+  side = int(np.ceil(np.sqrt(n)))
+  k = np.arange(n)
+  jitter = np.random.default_rng(0).uniform(-0.1, 0.1, (n, 2))
+  return np.column_stack((x + (k % side) * spacing, y + (k // side) * spacing)) + jitter
+
+def space_for(batched: bool, dtype=DTYPE) -> Space:
+  space = Space(1/120, dtype)
+  space.batched = batched
+  space.broadphase = UniformGrid()
+  return space
+
+def rectangle_scene(n: int, batched: bool, dtype=DTYPE) -> Space:
+  # n circles falling in a box twice as wide as the lattice they start in
+  spacing = 3 * RADIUS
+  side = int(np.ceil(np.sqrt(n))) * spacing
+  space = space_for(batched, dtype)
+  space.add_body(RectangleBorder(0, 0, 2 * side, 2 * side, 3))
+  for x, y in lattice(n, side / 2, side / 2, spacing):
+    space.add_body(Circle(x, y, RADIUS))
+  return space
+
+def circle_scene(n: int, batched: bool, dtype=DTYPE) -> Space:
+  # n circles falling in a circle border, the start lattice fits the inscribed square
+  spacing = 3 * RADIUS
+  side = int(np.ceil(np.sqrt(n))) * spacing
+  r = side
+  space = space_for(batched, dtype)
+  space.add_body(CircleBorder(r, r, r))
+  for x, y in lattice(n, r - side / 2, r - side / 2, spacing):
+    space.add_body(Circle(x, y, RADIUS))
+  return space
+
+def ring_scene(n: int, batched: bool, dtype=DTYPE) -> Space:
+  # examples/backwards.py: a ring of circles moving tangentially without gravity, run reversed
+  r = max(200, n * 2.5 * RADIUS / np.pi)
+  theta = np.linspace(0, np.pi * 2, n + 1)[:-1]
+  cx = cy = r + 60
+  space = space_for(batched, dtype)
+  space.gravity = 0, 0
+  for t in theta:
+    c = Circle(cx + r * np.cos(t), cy + r * np.sin(t), RADIUS)
+    c.prev_location = c.location - np.array((-np.sin(t), np.cos(t)), dtype=DTYPE) / 60
+    space.add_body(c)
+  space.add_body(RectangleBorder(10, 10, 2 * r + 100, 2 * r + 100, 100))
+  space.reverse().rev()
+  return space
+
+def rectangle(n: int, batched: bool) -> Callable[[], None]:
+  return rectangle_scene(n, batched).step
+
+def circle(n: int, batched: bool) -> Callable[[], None]:
+  return circle_scene(n, batched).step
+
+def ring(n: int, batched: bool) -> Callable[[], None]:
+  return ring_scene(n, batched).step
+
+def render(n: int, batched: bool, backend: str='numpy') -> Callable[[], None]:
+  # one raw frame of the rectangle scene, including the step between frames
+  side = int(np.ceil(np.sqrt(n))) * 3 * RADIUS
+  space = rectangle_scene(n, batched)
+  renderer = Renderer(space, max(1.0, 400 / (2 * side)))
+  renderer.backend = backend
+  frames = renderer.frames(1 << 62, raw=True)
+  return lambda: next(frames) and None
+
+SCENARIOS: dict[str, tuple[Scenario, str, tuple[int, ...]]] = {
+  'rectangle': (rectangle, 'steps', (100, 1000, 5000)),
+  'circle': (circle, 'steps', (100, 1000, 5000)),
+  'ring': (ring, 'steps', (30, 300, 3000)),
+  'render': (render, 'frames', (100, 1000)),
+}
+
+# the simulation scenes, for comparisons between precisions
+SCENES: dict[str, Callable[..., Space]] = {
+  'rectangle': rectangle_scene,
+  'circle': circle_scene,
+  'ring': ring_scene,
+}
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+from verlet_simple2d.shapes import Circle, CircleBorder, RectangleBorder
+from verlet_simple2d.space import Space
+
+
+def seeded_scene(count=20, seed=0, size=100, radius=(2, 5), gravity=None, ring=True, tag=0, batched=False, dtype=np.float64):
+  # `count` circles at seeded positions in the middle of a walled square, optionally inside a CircleBorder
+  # every `tag`-th circle gets collision type 7, the same arguments always build the same space
+  rng = np.random.default_rng(seed)
+  space = Space(1/120, dtype)
+  space.batched = batched
+  space.add_body(RectangleBorder(0, 0, size, size, 3))
+  if ring: space.add_body(CircleBorder(size / 2, size / 2, size * 0.4))
+  for k in range(count):
+    circle = Circle(*rng.uniform(size * 0.25, size * 0.75, 2), rng.uniform(*radius))
+    if tag and k % tag == 0: circle.collision_type = 7
+    space.add_body(circle)
+  if gravity is not None: space.gravity = (0, gravity)
+  return space
+
+@pytest.fixture
+def scene():
+  return seeded_scene
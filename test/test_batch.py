@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from verlet_simple2d.batch import SpaceBatch
+from verlet_simple2d.broadphase import UniformGrid
+from verlet_simple2d.emitter import Sink
+from verlet_simple2d.shapes import Circle
+
+
+def test_worlds_match_standalone_spaces(scene):
+  for inner in (None, UniformGrid()):
+    spaces = [scene(12, seed, 60, (1, 3), -10 - seed, tag=4, batched=True) for seed in range(5)]
+    batch = SpaceBatch(spaces, inner)
+    assert np.array_equal(batch.world_gravity[:, 1], [-10, -11, -12, -13, -14])
+    batch.run(60)
+    for space in spaces: space.run(60)
+
+    location = batch.per_world(batch.bodies.location)
+    collisions = batch.per_world(batch.bodies.collisions)
+    assert collisions.sum() > 0
+    for w, space in enumerate(spaces):
+      assert np.array_equal(location[w], space.bodies.location)
+      assert np.array_equal(collisions[w], space.bodies.collisions)
+
+  # sequential worlds resolve in a different order than the batch would
+  with pytest.raises(AssertionError):
+    SpaceBatch([scene(12, seed, 60, (1, 3), batched=seed == 0) for seed in range(2)])
+
+def test_worlds_are_fixed(scene, tmp_path):
+  batch = SpaceBatch([scene(12, seed, 60, (1, 3), -10 - seed, tag=4, batched=True) for seed in range(2)])
+  for mutate in (
+    lambda: batch.add_circles([30], [30], 2),
+    lambda: batch.add_body(Circle(30, 30, 2)),
+    lambda: batch.remove_bodies([0]),
+    lambda: batch.save(tmp_path / 'batch.npz'),
+    lambda: SpaceBatch.load(tmp_path / 'batch.npz'),
+  ):
+    with pytest.raises(TypeError):
+      mutate()
+  batch.sinks.append(Sink(0, 0, 10, 10))
+  with pytest.raises(TypeError):
+    batch.step()
+  batch.sinks.clear()
+
+  batch.gravity = 0, -5
+  batch.run(2)
+  assert batch.per_world(batch.bodies.location).shape == (2, 12, 2)
+  assert np.array_equal(batch.world_gravity, [[0, -5], [0, -5]])
+
+def test_worlds_keep_ccd(scene):
+  spaces = [scene(12, seed, 60, (1, 3), -10 - seed, tag=4, batched=True) for seed in range(3)]
+  for space in spaces: space.ccd = True
+  batch = SpaceBatch(spaces)
+  assert batch.ccd
+  batch.run(30)
+  for space in spaces: space.run(30)
+  for w, space in enumerate(spaces):
+    assert np.array_equal(batch.per_world(batch.bodies.location)[w], space.bodies.location)
@@ -0,0 +1,95 @@
+import numpy as np
+
+from verlet_simple2d.broadphase import BruteForce, NeighborList, SweepAndPrune, UniformGrid
+from verlet_simple2d.space import Space
+from verlet_simple2d.shapes import Circle, RectangleBorder
+
+
+def overlapping(pairs, location, radius):
+  i, j = pairs
+  hit = np.linalg.norm(location[i] - location[j], axis=1) < radius[i] + radius[j]
+  return set(zip(i[hit].tolist(), j[hit].tolist()))
+
+def random_circles(n, seed=0):
+  rng = np.random.default_rng(seed)
+  location = rng.uniform(0, np.sqrt(n) * 15, (n, 2))
+  radius = rng.uniform(2, 8, n)
+  return location, radius
+
+def pile(broadphase, n=60, steps=200):
+  rng = np.random.default_rng(1)
+  space = Space(1/120)
+  space.broadphase = broadphase
+  for _ in range(n):
+    space.add_body(Circle(rng.uniform(30, 170), rng.uniform(30, 370), rng.uniform(4, 9)))
+  space.add_body(RectangleBorder(0, 0, 200, 400, 10))
+  for _ in range(steps): space.step()
+  return space.bodies.location.copy()
+
+def test_pairs_are_sorted_and_unique():
+  location, radius = random_circles(500)
+  i, j = UniformGrid().pairs(location, radius)
+  assert np.all(i < j)
+  key = i * 500 + j
+  assert np.all(np.diff(key) > 0)
+
+def test_grid_finds_every_overlap():
+  location, radius = random_circles(800)
+  expected = overlapping(BruteForce().pairs(location, radius), location, radius)
+  assert overlapping(UniformGrid().pairs(location, radius), location, radius) == expected
+
+def test_grid_step_matches_brute_force():
+  assert np.array_equal(pile(UniformGrid()), pile(BruteForce()))
+
+def test_sweep_and_prune_finds_every_overlap_across_steps():
+  for dtype in (np.float64, np.float32):
+    location, radius = (a.astype(dtype) for a in random_circles(800))
+    sap = SweepAndPrune(margin=0)
+    rng = np.random.default_rng(2)
+    for _ in range(3):
+      expected = overlapping(BruteForce().pairs(location, radius), location, radius)
+      pairs = sap.pairs(location, radius)
+      assert overlapping(pairs, location, radius) == expected
+      assert sap.candidates == len(pairs[0])
+      assert sap.saved == 800 * 799 // 2 - sap.candidates
+      location = location + rng.normal(0, 0.5, location.shape).astype(dtype)
+
+def test_sweep_and_prune_step_matches_brute_force():
+  assert np.array_equal(pile(SweepAndPrune()), pile(BruteForce()))
+
+def test_neighbor_list_rebuilds_only_after_half_skin():
+  location, radius = random_circles(400)
+  nlist = NeighborList(skin=2)
+  for step in range(10):
+    moved = location + 0.09 * step
+    pairs = nlist.pairs(moved, radius)
+    expected = overlapping(BruteForce().pairs(moved, radius), moved, radius)
+    assert overlapping(pairs, moved, radius) == expected
+  # 0.09 per axis and step, rebuild once the displacement passes skin/2
+  assert nlist.calls == 10
+  assert nlist.rebuilds == 2
+  assert nlist.size > 0 and nlist.max_neighbors >= nlist.mean_neighbors > 0
+
+def test_bulk_churn_updates_caches_in_place():
+  for broadphase in (NeighborList(skin=20, inner=SweepAndPrune()), SweepAndPrune(margin=1)):
+    rng = np.random.default_rng(4)
+    space = Space(1/120)
+    space.batched = True
+    space.gravity = 0, 0
+    space.broadphase = broadphase
+    space.add_body(RectangleBorder(0, 0, 300, 300, 3))
+    location, _ = random_circles(300)
+    space.add_circles(location[:, 0] % 280 + 10, location[:, 1] % 280 + 10, 3, velocity=rng.normal(0, 0.1, (300, 2)))
+    space.step()
+    for _ in range(30):
+      space.remove_bodies(rng.choice(space.bodies.n, 3, replace=False))
+      x, y = rng.uniform(10, 290, (2, 4))
+      space.add_circles(x, y, 3, velocity=rng.normal(0, 0.1, (4, 2)))
+      b = space.bodies
+      i, j = pairs = broadphase.pairs(b.location, b.radius)
+      assert np.all(i < j) and np.all(np.diff(i * b.n + j) > 0)
+      assert overlapping(pairs, b.location, b.radius) == overlapping(BruteForce().pairs(b.location, b.radius), b.location, b.radius)
+      space.step()
+    if isinstance(broadphase, NeighborList):
+      # the skin covers all motion, so only the first step built the list
+      assert broadphase.rebuilds == 1
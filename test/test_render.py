@@ -0,0 +1,89 @@
+import subprocess
+import sys
+
+import ffmpeg
+import numpy as np
+import pytest
+from PIL import ImageFont
+
+from verlet_simple2d.render import Renderer
+
+
+def test_parallel_frames_match_serial(scene, tmp_path):
+  (tmp_path / 'serial').mkdir()
+  (tmp_path / 'parallel').mkdir()
+  Renderer(scene(40, batched=True), 2.0, step_size=3).render_frames(4, str(tmp_path / 'serial' / 'frame-{:08d}.jpg'))
+  Renderer(scene(40, batched=True), 2.0, step_size=3).render_frames(4, str(tmp_path / 'parallel' / 'frame-{:08d}.jpg'), workers=2)
+
+  for i in range(4):
+    name = f'frame-{i:08d}.jpg'
+    assert (tmp_path / 'serial' / name).read_bytes() == (tmp_path / 'parallel' / name).read_bytes()
+  assert (tmp_path / 'serial' / 'frame-00000000.jpg').read_bytes() != (tmp_path / 'serial' / 'frame-00000003.jpg').read_bytes()
+
+def test_raw_frames_are_rgb24_in_order(scene):
+  renderer = Renderer(scene(40, batched=True), 2.0, step_size=3)
+  expected = Renderer(scene(40, batched=True), 2.0, step_size=3)
+  size = int(renderer.width * renderer.scale) * int(renderer.height * renderer.scale) * 3
+  for data in renderer.frames(3, workers=2, raw=True):
+    assert data == expected.render_current_frame().tobytes()
+    assert len(data) == size
+    expected.space.run(3)
+
+def test_background_is_cached_until_statics_change(scene):
+  space = scene(40, batched=True)
+  renderer = Renderer(space, 2.0)
+  canvas = renderer.canvas()
+  background = canvas.background()
+  renderer.render_current_frame()
+  assert renderer.canvas() is canvas and canvas.background() is background
+
+  space.statics[1].radius = 25
+  assert renderer.canvas() is not canvas
+
+def test_numpy_backend_matches_pil_up_to_edges(scene):
+  renderer = Renderer(scene(40, batched=True), 3.0)
+  expected = np.asarray(renderer.render_current_frame())
+  renderer.backend = 'numpy'
+  frame = renderer.canvas().draw_array(renderer.snapshot())
+
+  assert frame.shape == expected.shape and frame.dtype == np.uint8
+  assert np.array_equal(np.asarray(renderer.render_current_frame()), frame)
+  differ = (frame != expected).any(axis=2)
+  covered = (expected != np.asarray(renderer.canvas().background())).any(axis=2)
+  assert differ.sum() < 0.1 * covered.sum()
+
+def fake_ffmpeg(monkeypatch, script, calls):
+  # runs script in place of ffmpeg, with the output file as its argument
+  def run_async(stream, pipe_stdin=False, pipe_stderr=False, **kwargs):
+    args = stream.get_args()
+    calls.append(args)
+    return subprocess.Popen(
+      [sys.executable, '-c', script, next(a for a in args if a.endswith('.mp4'))],
+      stdin=subprocess.PIPE if pipe_stdin else None, stderr=subprocess.PIPE if pipe_stderr else None,
+    )
+  monkeypatch.setattr(ffmpeg.nodes.OutputStream, 'run_async', run_async)
+  # render() watermarks with system fonts that aren't installed everywhere
+  font = ImageFont.load_default()
+  monkeypatch.setattr(ImageFont, 'truetype', lambda *args: font)
+
+def test_stream_pipes_every_frame_and_keeps_frames(scene, tmp_path, monkeypatch):
+  calls: list[list[str]] = []
+  fake_ffmpeg(monkeypatch, 'import sys; open(sys.argv[1], "w").write(str(len(sys.stdin.buffer.read())))', calls)
+  renderer = Renderer(scene(batched=True), 2.0)
+  renderer.render(3, path=str(tmp_path), stream=True, codec='libx265', crf=28, keep_frames=True)
+
+  (project,) = tmp_path.iterdir()
+  size = int(renderer.width * renderer.scale) * int(renderer.height * renderer.scale) * 3
+  assert (project / 'video.mp4').read_text() == str(3 * size)
+  assert len(list((project / 'frames').glob('frame-*.jpg'))) == 3
+  args = calls[0]
+  assert args[args.index('-vcodec') + 1] == 'libx265' and args[args.index('-crf') + 1] == '28'
+
+def test_stream_raises_when_ffmpeg_fails(scene, tmp_path, monkeypatch):
+  fake_ffmpeg(monkeypatch, 'import sys; sys.stderr.write("Unknown encoder"); sys.exit(1)', [])
+  with pytest.raises(ffmpeg.Error) as error:
+    Renderer(scene(batched=True), 2.0).render(40, path=str(tmp_path), stream=True, codec='nope')
+  assert error.value.stderr == b'Unknown encoder'
+  # nothing but the project directory, frames aren't kept by default
+  (project,) = tmp_path.iterdir()
+  assert not (project / 'frames').exists()
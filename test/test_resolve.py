@@ -1,3 +1,6 @@
+import numpy as np
+
+from verlet_simple2d.handler import CircleCircleHandler
 from verlet_simple2d.space import Space
 from verlet_simple2d.shapes import Circle, CircleBorder, RectangleBorder
 from verlet_simple2d.render import Renderer
@@ -27,3 +30,50 @@ def test_resolve_circle_circle():
 
   print(circle1)
   print(circle2)
+
+def test_resolve_batch_matches_resolve():
+  single, batch = Space(1/120), Space(1/120)
+  for space in (single, batch):
+    rng = np.random.default_rng(3)
+    for _ in range(3):
+      circle = Circle(*rng.uniform(40, 60, 2), rng.uniform(8, 12))
+      circle.mass = rng.uniform(1, 3)
+      circle.prev_location = circle.location - rng.normal(0, 1, 2)
+      space.add_body(circle)
+
+  handler = CircleCircleHandler()
+  kin = single.kinetics
+  for a, b in ((0, 1), (1, 2), (0, 2)):
+    if handler.check(kin[a], kin[b]): handler.resolve(kin[a], kin[b])
+  for a, b in ((0, 1), (1, 2), (0, 2)):
+    i, j = np.array([a]), np.array([b])
+    hit = handler.check_batch(batch.bodies, i, j)
+    handler.resolve_batch(batch.bodies, i[hit], j[hit])
+
+  assert np.allclose(single.bodies.location, batch.bodies.location)
+  assert np.allclose(single.bodies.prev_location, batch.bodies.prev_location)
+  assert np.array_equal(single.bodies.collisions, batch.bodies.collisions)
+
+def test_border_resolve_batch_matches_resolve():
+  for border in (RectangleBorder(0, 0, 100, 100, 10), CircleBorder(50, 50, 50)):
+    single, batch = Space(1/120), Space(1/120)
+    for space in (single, batch):
+      rng = np.random.default_rng(4)
+      for _ in range(40):
+        angle, distance = rng.uniform(0, 2 * np.pi), rng.uniform(38, 47)
+        circle = Circle(50 + distance * np.cos(angle), 50 + distance * np.sin(angle), 5)
+        circle.prev_location = circle.location - (circle.location - 50) * rng.uniform(0.02, 0.1)
+        space.add_body(circle)
+      space.add_body(border)
+
+    handler = single.get_collision_handler(single.kinetics[0], border)
+    hit = [kin for kin in single.kinetics if handler.check(kin, border)]
+    for kin in hit: handler.resolve(kin, border)
+
+    idx = np.arange(40)
+    mask = handler.check_batch(batch.bodies, idx, border)
+    handler.resolve_batch(batch.bodies, idx[mask], border)
+
+    assert mask.sum() == len(hit) > 0
+    assert np.allclose(single.bodies.location, batch.bodies.location)
+    assert np.allclose(single.bodies.prev_location, batch.bodies.prev_location)
@@ -0,0 +1,360 @@
+import numpy as np
+import pytest
+
+from verlet_simple2d import shapes
+from verlet_simple2d.broadphase import SweepAndPrune
+from verlet_simple2d.emitter import Emitter, Sink
+from verlet_simple2d.helpers import pair_colors
+from verlet_simple2d.space import Space
+from verlet_simple2d.shapes import Circle, RectangleBorder
+from verlet_simple2d.stats import StepStats
+from verlet_simple2d.store import LOOSE
+from verlet_simple2d.trajectory import Trajectory
+
+
+def test_bodies_are_views_into_space_arrays():
+  circle1 = Circle(10, 20, 5)
+  circle1.prev_location = circle1.location - (1, 0)
+  circle2 = Circle(30, 40, 6)
+
+  space = Space(1/120)
+  space.add_body(circle1)
+  space.add_body(circle2)
+
+  assert space.kinetics == [circle1, circle2]
+  assert np.array_equal(space.bodies.location, [[10, 20], [30, 40]])
+  assert np.array_equal(space.bodies.radius, [5, 6])
+
+  space.bodies.location[1] += 1
+  assert circle2.x == 31 and circle2.y == 41
+
+  circle1.location += (1, 1)
+  assert np.array_equal(circle1.location - circle1.prev_location, [2, 1])
+
+  space.remove_body(circle1)
+  assert space.kinetics == [circle2]
+  assert circle2.x == 31
+  assert circle1.x == 11 and circle1.radius == 5
+
+def test_standalone_bodies_share_rows_of_one_store():
+  kept, dropped = Circle(1, 2, 3), Circle(4, 5, 6)
+  assert kept._store is dropped._store is LOOSE
+  row = dropped._index
+  del dropped
+  # the row of a collected body is handed to the next one, fully reset
+  fresh = Circle(7, 8, 9)
+  assert fresh._index == row and fresh.mass == 1 and not fresh.force.any()
+  assert kept.x == 1 and kept.radius == 3
+
+  space = Space(1/120)
+  space.add_body(fresh)
+  assert fresh._store is space.bodies and fresh.radius == 9
+  space.remove_body(fresh)
+  assert fresh._store is LOOSE and fresh.x == 7 and fresh.radius == 9
+
+def test_bodies_of_another_space_are_rejected():
+  for count in (1, 3):
+    a, b = Space(1/120), Space(1/120)
+    circles = [Circle(10 * k, 0, 2) for k in range(count)]
+    for circle in circles: a.add_body(circle)
+    with pytest.raises(ValueError):
+      b.add_body(circles[0])
+    assert a.kinetics == circles and circles[0]._store is a.bodies and b.bodies.n == 0
+    a.remove_body(circles[0])
+    b.add_body(circles[0])
+    assert b.kinetics == circles[:1] and a.bodies.n == count - 1
+
+def test_shapes_are_slotted_and_validate_in_debug_mode(monkeypatch):
+  circle, border = Circle(1, 2, 3), RectangleBorder(0, 0, 10, 10, 1)
+  assert not hasattr(circle, '__dict__') and not hasattr(border, '__dict__')
+  with pytest.raises(AssertionError):
+    Circle(1, 2, '3')
+
+  monkeypatch.setattr(shapes, 'DEBUG', False)
+  circle.x = np.float32(4)
+  assert circle.x == 4
+  monkeypatch.setattr(shapes, 'DEBUG', True)
+  circle.x, circle.radius, border.width = np.float32(5), np.float64(2), np.int64(12)
+  assert circle.x == 5 and circle.radius == 2 and border.width == 12
+  with pytest.raises(AssertionError):
+    circle.location = 'ab'
+  with pytest.raises(AssertionError):
+    border.width = None
+
+def test_integrate_applies_gravity_acceleration_and_force():
+  circle1 = Circle(0, 0, 1)
+  circle2 = Circle(10, 0, 1)
+  circle2.mass = 2
+  circle2.force = (4, 0)
+  circle2.acceleration = (0, 1)
+
+  space = Space(0.5)
+  space.gravity = 0, -8
+  space.add_body(circle1)
+  space.add_body(circle2)
+  space.integrate()
+
+  assert np.array_equal(circle1.location, [0, -2])
+  assert np.array_equal(circle2.location, [10.5, -1.75])
+  assert np.array_equal(space.bodies.prev_location, [[0, 0], [10, 0]])
+
+def test_handlers_are_resolved_per_type_pair():
+  space = Space(1/120)
+  circles = [Circle(i * 3, 0, 1) for i in range(200)]
+  special = Circle(-10, 0, 1)
+  special.collision_type = 3
+  for circle in circles: space.add_body(circle)
+  space.add_body(special)
+  space.add_body(RectangleBorder(-20, -20, 700, 100, 1))
+
+  assert [handler.types for handler in space.collision_handlers] == [
+    (Circle, Circle),
+    (3, 3),
+    (RectangleBorder, Circle),
+  ]
+  assert space.get_collision_handler(circles[0], special) is space.collision_handlers[0]
+  assert space.get_collision_handler(special, special) is space.collision_handlers[1]
+
+def test_pair_colors_never_share_a_body():
+  rng = np.random.default_rng(0)
+  i = rng.integers(0, 50, 400)
+  j = rng.integers(0, 50, 400)
+  i, j = i[i != j], j[i != j]
+  color = pair_colors(i, j, 50)
+  assert color.min() == 0
+  for c in range(color.max() + 1):
+    bodies = np.concatenate((i[color == c], j[color == c]))
+    assert len(bodies) == len(np.unique(bodies))
+
+@pytest.mark.parametrize('batched', [False, True])
+def test_run_matches_step_and_fires_every_k_steps(scene, batched):
+  stepped, ran = scene(batched=batched), scene(batched=batched)
+  expected = []
+  for k in range(1, 11):
+    stepped.step()
+    if k % 3 == 0: expected.append(stepped.bodies.location.copy())
+
+  calls = []
+  frames = ran.run(10, callback=lambda space, k: calls.append(k), every=3, capture=True)
+  assert calls == [3, 6, 9]
+  assert np.array_equal(frames, expected)
+  assert np.array_equal(ran.bodies.location, stepped.bodies.location)
+
+def test_checkpoint_restores_identical_steps(scene, tmp_path):
+  space = scene(30, 3, radius=(2, 4), ring=False, tag=3, batched=False)
+  space.broadphase = SweepAndPrune(margin=1)
+  space.run(20)
+
+  space.save(tmp_path / 'space.npz')
+  restored = Space.load(tmp_path / 'space.npz')
+  assert restored.steps == 20 and restored.dt == space.dt
+  assert [type(h) for h in restored.collision_handlers] == [type(h) for h in space.collision_handlers]
+  assert [c.collision_type for c in restored.kinetics] == [c.collision_type for c in space.kinetics]
+
+  space.run(40)
+  restored.run(40)
+  assert np.array_equal(restored.bodies.location, space.bodies.location)
+  assert np.array_equal(restored.bodies.collisions, space.bodies.collisions)
+  assert restored.statics[0]._collisions == space.statics[0]._collisions
+
+def test_checkpoint_keeps_sleeping_bodies_asleep(tmp_path):
+  space = Space(1/120)
+  space.batched = True
+  space.add_body(RectangleBorder(0, 0, 100, 100, 3))
+  for k in range(15):
+    space.add_body(Circle(20 + 4 * k, 50, 2))
+  space.sleep_threshold = 0.5
+  space.sleep_steps = 10
+  space.run(20)
+  assert space.sleeping == 15
+
+  space.save(tmp_path / 'space.npz')
+  restored = Space.load(tmp_path / 'space.npz')
+  assert restored.sleeping == 15 and restored.sleep_threshold == 0.5 and restored.sleep_steps == 10
+  space.run(100)
+  restored.run(100)
+  assert np.array_equal(restored.bodies.location, space.bodies.location)
+
+def test_sleepers_wake_when_their_force_or_acceleration_changes():
+  space = Space(1/120)
+  space.gravity = 0, 0
+  space.add_body(RectangleBorder(0, 0, 100, 100, 3))
+  circles = [Circle(20 + 4 * k, 50, 2) for k in range(5)]
+  for circle in circles:
+    space.add_body(circle)
+    circle.force = (0, -10)
+  space.sleep_threshold = 0.5
+  space.sleep_steps = 10
+  space.run(20)
+  # a constant force doesn't keep the row awake
+  held = space.bodies.location.copy()
+  space.run(20)
+  assert space.sleeping == 5 and np.array_equal(space.bodies.location, held)
+
+  circles[0].acceleration = (0, 500)
+  space.step()
+  assert space.sleeping == 0 and circles[0].y > held[0, 1]
+  space.run(20)
+  assert space.sleeping == 5
+  circles[1].force = (0, 0)
+  space.step()
+  assert space.sleeping == 0
+
+def test_stats_count_phases_without_changing_results(scene):
+  logged: list[str] = []
+  for batched in (False, True):
+    space, plain = scene(30, 4, radius=(2, 4), ring=False, batched=batched), scene(30, 4, radius=(2, 4), ring=False, batched=batched)
+    space.stats = StepStats(window=10, log=logged.append)
+    space.run(25)
+    plain.run(25)
+    assert np.array_equal(space.bodies.location, plain.bodies.location)
+
+    last = space.stats.last
+    assert last is not None and last['steps'] == 10 and space.stats.steps == 5
+    assert last['counts']['pairs_tested'] == 10 * 30 * 29 // 2
+    assert last['counts']['border_tests'] == 10 * 30
+    assert last['counts']['pairs_colliding'] > 0
+    assert {'step', 'integrate', 'broadphase', 'narrow', 'check', 'borders', 'resolve:CircleCircleHandler'} <= set(last['times'])
+  assert len(logged) == 4
+
+def test_sleeping_islands_wake_on_contact():
+  def scene(sleep):
+    space = Space(1/120)
+    space.gravity = 0, 0
+    space.add_body(RectangleBorder(0, 0, 100, 100, 3))
+    for k in range(5):
+      space.add_body(Circle(30 + 4 * k, 50, 2))
+    ball = Circle(80, 50, 2)
+    ball.prev_location = ball.location + (0.05, 0)
+    space.add_body(ball)
+    space.sleep_threshold = 1e-3 if sleep else None
+    space.sleep_steps = 30
+    return space
+
+  sleepy, plain = scene(True), scene(False)
+  sleeping: list[int] = []
+  sleepy.run(1000, lambda space, _: sleeping.append(space.sleeping))
+  plain.run(1000)
+  # the row falls asleep as one island, the ball wakes all of it and it settles again after the hit
+  assert sleeping[100] == 5 and min(sleeping) == 0 and sleeping[-1] == 5
+  assert sleepy.bodies.collisions[:5].sum() > 0
+  assert np.array_equal(sleepy.bodies.location, plain.bodies.location)
+
+def test_ccd_resolves_head_on_at_time_of_impact():
+  # two circles meet after 0.3s and swap velocities, at t=1 they are back at 28 and 72
+  def scene(dt, ccd, batched):
+    space = Space(dt)
+    space.gravity = 0, 0
+    space.batched = batched
+    space.ccd = ccd
+    space.add_body(RectangleBorder(0, 0, 100, 100, 3))
+    a, b = Circle(40, 50, 1), Circle(60, 50, 1)
+    a.prev_location = a.location - (30 * dt, 0)
+    b.prev_location = b.location + (30 * dt, 0)
+    space.add_body(a)
+    space.add_body(b)
+    space.run(round(1 / dt))
+    return a.x, b.x
+
+  assert scene(1/240, False, False) != (28, 72)
+  for batched in (False, True):
+    for dt in (1/240, 1/24, 1/12):
+      a, b = scene(dt, True, batched)
+      assert np.isclose(a, 28) and np.isclose(b, 72)
+
+  space = Space(1/60)
+  space.ccd = True
+  space.add_body(Circle(10, 10, 1))
+  space.add_body(Circle(20, 10, 1))
+  assert [type(h).__name__ for h in space.collision_handlers] == ['SweptCircleCircleHandler']
+  space.ccd = False
+  assert [type(h).__name__ for h in space.collision_handlers] == ['CircleCircleHandler']
+
+@pytest.mark.parametrize('batched', [False, True])
+def test_float32_space_keeps_single_precision(scene, batched, tmp_path):
+  single = scene(10, radius=(2, 2), ring=False, batched=batched, dtype=np.float32)
+  double = scene(10, radius=(2, 2), ring=False, batched=batched)
+  single.run(30)
+  double.run(30)
+  b = single.bodies
+  assert {b.location.dtype, b.prev_location.dtype, b.radius.dtype, single.gravity.dtype, single.dt.dtype} == {np.dtype(np.float32)}
+  assert np.allclose(b.location, double.bodies.location, atol=1e-3)
+
+  single.record(str(tmp_path / 'run.trj')).close()
+  assert Trajectory(tmp_path / 'run.trj').location.dtype == np.float32
+  single.save(tmp_path / 'space.npz')
+  assert Space.load(tmp_path / 'space.npz').bodies.location.dtype == np.float32
+
+def test_add_circles_matches_add_body():
+  rng = np.random.default_rng(5)
+  x, y = rng.uniform(10, 90, (2, 40))
+  r = rng.uniform(1, 3, 40)
+  velocity = rng.normal(0, 0.2, (40, 2))
+  types = np.where(np.arange(40) % 4 == 0, 3, 5)
+
+  one, bulk = Space(1/120), Space(1/120)
+  for space in (one, bulk):
+    space.add_body(RectangleBorder(0, 0, 100, 100, 3))
+  for k in range(40):
+    circle = Circle(x[k], y[k], r[k])
+    circle.prev_location = circle.location - velocity[k]
+    circle.collision_type = int(types[k])
+    one.add_body(circle)
+  assert bulk.add_circles(x, y, r, velocity=velocity, collision_type=types) is None
+  assert all(handle is None for handle in bulk.bodies.handles)
+
+  one.run(50)
+  bulk.run(50)
+  assert np.array_equal(one.bodies.location, bulk.bodies.location)
+  assert [c.collision_type for c in bulk.kinetics] == types.tolist()
+
+  handles = bulk.add_circles([50], [50], 2, handles=True)
+  assert handles is not None and handles[0].radius == 2 and bulk.kinetics[-1] is handles[0]
+  first = bulk.kinetics[0]
+  bulk.remove_body(first)
+  # the last body fills the hole
+  assert bulk.bodies.n == 40 and bulk.kinetics[0] is handles[0] and handles[0]._index == 0
+  assert first._store is not bulk.bodies and first.radius == r[0]
+
+def test_emitter_and_sink_churn():
+  space = Space(1/120)
+  space.batched = True
+  space.add_body(RectangleBorder(0, 0, 200, 50, 3))
+  space.emitters.append(Emitter(5, 10, 600, 1, width=4, height=30, velocity=(300, 0), spread=5, seed=2))
+  space.sinks.append(Sink(180, 0, 20, 50))
+  tracked = space.add_circles([100], [25], 1, handles=True)[0]
+
+  space.run(60)
+  assert space.emitters[0].emitted == 300 and space.bodies.n == 301
+  for _ in range(5):
+    space.run(60)
+    # bodies enter as fast as they leave, the store doesn't keep growing
+    assert space.bodies.capacity <= 512
+  emitted, absorbed = space.emitters[0].emitted, space.sinks[0].absorbed
+  assert emitted == 1800 and absorbed > 0 and space.bodies.n == 1 + emitted - absorbed
+  assert np.all(space.bodies.location[:, 0] < 180)
+  # handles follow their body through the swap-removes
+  if tracked._store is space.bodies:
+    assert space.bodies.handles[tracked._index] is tracked
+
+def test_bulk_churn_keeps_layout_and_sleep():
+  space = Space(1/120)
+  space.batched = True
+  space.gravity = 0, 0
+  space.add_body(RectangleBorder(0, 0, 100, 100, 3))
+  space.add_circles(30 + 4 * np.arange(5), 50, 2)
+  space.add_circles([80], [20], 2, collision_type=3)
+  space.sleep_threshold = 1e-3
+  space.sleep_steps = 10
+  space.run(20)
+  layout = space._layout()
+  assert space.sleeping == 6
+
+  for k in range(10):
+    space.add_circles([10 + 8 * k, 10 + 8 * k], [80, 90], 1, collision_type=3)
+    space.step()
+    # row 6 is the oldest of the new circles, the last row takes its place
+    space.remove_bodies([6])
+  # everything asleep stays asleep and nothing needed new handlers, so the layout only regrouped
+  assert space.sleeping >= 6 and space._layout() is layout
+  assert space.bodies.n == 16
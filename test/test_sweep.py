@@ -0,0 +1,22 @@
+from functools import partial
+
+import numpy as np
+
+from verlet_simple2d.sweep import grid, sweep
+
+
+def test_grid_covers_every_combination():
+  assert grid(a=[1, 2], b='xy') == [{'a': 1, 'b': 'x'}, {'a': 1, 'b': 'y'}, {'a': 2, 'b': 'x'}, {'a': 2, 'b': 'y'}]
+
+def test_parallel_sweep_matches_serial(scene):
+  build = partial(scene, size=50, radius=(2, 2), ring=False, batched=True)
+  params = grid(count=[5, 10], gravity=[0, -10])
+  serial = sorted(sweep(build, params, 30), key=lambda r: r.run)
+  parallel = sorted(sweep(build, params, 30, workers=2), key=lambda r: r.run)
+
+  assert [r.params for r in parallel] == params
+  for s, p in zip(serial, parallel):
+    assert np.array_equal(s.location, p.location)
+    assert s.collisions == p.collisions and s.energy_drift == p.energy_drift
+  assert parallel[3].location.shape == (10, 2)
+  assert parallel[3].collisions > 0
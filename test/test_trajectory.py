@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from verlet_simple2d.emitter import Emitter, Sink
+from verlet_simple2d.render import Renderer
+from verlet_simple2d.trajectory import Trajectory
+
+
+@pytest.mark.parametrize('batched', [False, True])
+def test_recorded_frames_match_captured_run(scene, batched, tmp_path):
+  space = scene(batched=batched)
+  writer = space.record(str(tmp_path / 'run.trj'), every=3, radius=True, collisions=True)
+  space.run(11)
+  # readable while still recording
+  assert len(Trajectory(tmp_path / 'run.trj')) == 4
+  writer.close()
+  space.run(3)
+
+  traj = Trajectory(tmp_path / 'run.trj')
+  captured = scene(batched=batched).run(9, every=3, capture=True)
+  assert len(traj) == 4 and traj.n == 20 and traj.every == 3
+  assert np.array_equal(traj.location[0], scene(batched=batched).bodies.location)
+  assert np.array_equal(traj.frames(1), captured)
+  assert np.array_equal(traj.radius[2], space.bodies.radius)
+  assert isinstance(traj.location.base, np.memmap)
+  assert traj.collisions[-1].sum() > 0
+
+def test_replay_renders_like_live(scene, tmp_path):
+  space = scene(batched=True)
+  writer = space.record(str(tmp_path / 'run.trj'), every=2)
+  space.run(6)
+  writer.close()
+
+  replay = Renderer(scene(batched=True), 2.0)
+  replay.trajectory = Trajectory(tmp_path / 'run.trj')
+  live = Renderer(scene(batched=True), 2.0, step_size=2)
+  frames = list(replay.frames(10, raw=True))
+  assert len(frames) == 4
+  assert frames == list(live.frames(4, raw=True))
+
+def test_recording_needs_a_fixed_body_count(scene, tmp_path):
+  space = scene()
+  space.emitters.append(Emitter(50, 50, 600, 1))
+  with pytest.raises(ValueError):
+    space.record(str(tmp_path / 'run.trj'))
+  with pytest.raises(ValueError):
+    space.run(3, capture=True)
+
+  space.emitters.clear()
+  writer = space.record(str(tmp_path / 'run.trj'))
+  space.sinks.append(Sink(0, 0, 100, 100))
+  with pytest.raises(ValueError):
+    space.step()
+  # nothing was stepped or absorbed
+  assert space.steps == 0 and space.bodies.n == 20
+  writer.close()
+  space.step()
+  assert space.bodies.n == 0 and len(Trajectory(tmp_path / 'run.trj')) == 1
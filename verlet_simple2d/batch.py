@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+from numpy.typing import NDArray
+
+from verlet_simple2d import DTYPE, helpers, shapes
+from verlet_simple2d.broadphase import Broadphase, WorldBroadphase
+from verlet_simple2d.space import Space
+
+_FIXED = 'the worlds of a SpaceBatch are fixed, build it from spaces that already hold the bodies'
+
+
+class SpaceBatch(Space):
+  # steps B independent copies (worlds) of one scene as a single space, world w owns rows w*n:(w+1)*n
+  # the worlds may differ in body state and gravity but share the borders, handlers, dt and ccd of the first one,
+  # every world ends up exactly where the same scene stepped alone with Space.batched would
+  # borders are shared too, so their collision counts add up over all worlds
+  def __init__(self, spaces: list[Space], inner: Broadphase | None=None) -> None:
+    assert len(spaces) > 0, 'need at least one space'
+    first = spaces[0]
+    super().__init__(first.dt, first.dtype)
+    self.worlds: int = len(spaces)
+    self.n: int = first.bodies.n
+    for space in spaces:
+      assert space.dt == first.dt and space.dtype == first.dtype, 'all worlds need the same dt and dtype'
+      assert space.ccd == first.ccd, 'all worlds need the same ccd'
+      assert space.batched, 'all worlds need Space.batched, a SpaceBatch only reproduces the batched path'
+      assert space.bodies.n == self.n, 'all worlds need the same number of bodies'
+      assert np.array_equal(space.bodies.kind, first.bodies.kind), 'all worlds need the same kinds of bodies'
+      assert np.array_equal(space.bodies.collision_type, first.bodies.collision_type), 'all worlds need the same collision types'
+
+    self.batched = True
+    # the handlers below are already swept if ccd is on, the flag sweeps the broadphase bounds to match
+    self._ccd = first.ccd
+    self.broadphase = WorldBroadphase(self.worlds, inner)
+    self.collision_handlers = list(first.collision_handlers)
+    self._body_kinds = dict(first._body_kinds)
+    self._static_kinds = dict(first._static_kinds)
+    self.statics = list(first.statics)
+
+    stores = [space.bodies for space in spaces]
+    self._bodies.restore({name: np.concatenate([getattr(b, name)[:b.n] for b in stores]) for name in self._bodies.fields()})
+    self.world_gravity = np.array([space.gravity for space in spaces], dtype=self.dtype)
+    # world local body ids, so pairs get colored (and resolved) exactly like in a standalone space
+    self._local_ids: NDArray[np.intp] = np.tile(np.arange(self.n, dtype=np.intp), self.worlds)
+    self._version += 1
+
+  @property
+  def gravity(self) -> NDArray[DTYPE]:
+    return self._gravity
+
+  @gravity.setter
+  def gravity(self, val) -> None:
+    # one gravity for every world
+    self.world_gravity = val
+
+  @property
+  def world_gravity(self) -> NDArray[DTYPE]:
+    return self._gravity[::self.n] if self.n else np.zeros((self.worlds, 2), dtype=self.dtype)
+
+  @world_gravity.setter
+  def world_gravity(self, val) -> None:
+    # one gravity per world, expanded to one row per body so integrate adds it like a shared one
+    val = np.broadcast_to(np.asarray(val, dtype=self.dtype), (self.worlds, 2))
+    self._gravity = np.repeat(val, self.n, axis=0)
+
+  def per_world(self, arr: NDArray) -> NDArray:
+    # a (B*n, ...) body array as a (B, n, ...) view
+    return arr.reshape(self.worlds, self.n, *arr.shape[1:])
+
+  # the worlds are fixed: everything that would add or remove bodies, borders or worlds raises TypeError
+  def add_body(self, body: shapes.Body | shapes.Border) -> None:
+    raise TypeError(_FIXED)
+
+  def add_circles(self, *args, **kwargs) -> list[shapes.Circle] | None:
+    raise TypeError(_FIXED)
+
+  def remove_body(self, body: shapes.Body | shapes.Border) -> None:
+    raise TypeError(_FIXED)
+
+  def remove_bodies(self, rows: NDArray[np.intp]) -> None:
+    raise TypeError(_FIXED)
+
+  def step(self) -> None:
+    # emitters and sinks would add and remove bodies
+    if self.emitters or self.sinks: raise TypeError(_FIXED)
+    super().step()
+
+  def save(self, path: str | Path) -> None:
+    raise TypeError('save the individual worlds instead')
+
+  @classmethod
+  def load(cls, path: str | Path) -> Space:
+    raise TypeError('load the individual worlds and batch them instead')
+
+  def _pair_colors(self, first: NDArray[np.intp], second: NDArray[np.intp]) -> NDArray[np.intp]:
+    return helpers.pair_colors(first, second, self._bodies.n, self._local_ids)
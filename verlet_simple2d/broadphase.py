@@ -0,0 +1,365 @@
+from __future__ import annotations
+
+from abc import abstractmethod
+
+import numpy as np
+from numpy.typing import NDArray
+
+from verlet_simple2d import DTYPE
+
+Pairs = tuple[NDArray[np.intp], NDArray[np.intp]]
+
+
+def _empty() -> Pairs:
+  return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+def _expand(lo: NDArray[np.intp], hi: NDArray[np.intp]) -> Pairs:
+  # for every k yields (k, t) for t in range(lo[k], hi[k]), without a python loop
+  counts = np.maximum(hi - lo, 0)
+  total = int(counts.sum())
+  if total == 0: return _empty()
+  src = np.repeat(np.arange(len(lo), dtype=np.intp), counts)
+  starts = np.cumsum(counts) - counts
+  tgt = np.arange(total, dtype=np.intp) - np.repeat(starts - lo, counts)
+  return src, tgt
+
+def _sorted_pairs(a: NDArray[np.intp], b: NDArray[np.intp], n: int) -> Pairs:
+  # (i, j) with i < j in the order the brute force loops visit them
+  # sorting the packed keys themselves is much cheaper than arg-sorting them
+  key = np.sort(np.minimum(a, b).astype(np.int64) * n + np.maximum(a, b))
+  i, j = np.divmod(key, n)
+  return i.astype(np.intp, copy=False), j.astype(np.intp, copy=False)
+
+def _merge_pairs(p: Pairs, q: Pairs) -> Pairs:
+  # two sorted pair lists as one, without sorting p again
+  if len(q[0]) == 0: return p
+  key_p = p[0].astype(np.int64) << 32 | p[1]
+  key_q = q[0].astype(np.int64) << 32 | q[1]
+  at = np.searchsorted(key_p, key_q)
+  return np.insert(p[0], at, q[0]), np.insert(p[1], at, q[1])
+
+def _remap(n: int, rows: NDArray[np.intp], holes: NDArray[np.intp], movers: NDArray[np.intp]) -> NDArray[np.intp]:
+  # old row -> new row after a swap-remove of rows from n rows, -1 for removed rows
+  remap = np.arange(n, dtype=np.intp)
+  remap[rows] = -1
+  remap[movers] = holes
+  return remap
+
+
+class Broadphase:
+  # produces the candidate pairs (i, j), i < j, sorted by i then j, that the narrow phase checks
+  @abstractmethod
+  def pairs(self, location: NDArray[DTYPE], radius: NDArray[DTYPE]) -> Pairs: pass
+
+  def invalidate(self) -> None:
+    # called by Space whenever bodies are added or removed one by one
+    pass
+
+  # bodies added or removed in bulk (emitters, sinks) are reported row by row instead, so caches
+  # can be updated rather than rebuilt, broadphases without an incremental path just start over
+  def appended(self, location: NDArray[DTYPE], radius: NDArray[DTYPE], start: int) -> None:
+    # rows start: are new, location and radius cover all rows
+    self.invalidate()
+
+  def removed(self, rows: NDArray[np.intp], holes: NDArray[np.intp], movers: NDArray[np.intp]) -> None:
+    # the sorted unique rows were swap-removed, the surviving last rows movers now sit at holes
+    self.invalidate()
+
+  def config(self) -> dict:
+    # constructor arguments, from_config(config()) builds an equivalent broadphase with empty caches
+    return {'class': type(self).__name__}
+
+def from_config(config: dict) -> Broadphase:
+  args = dict(config)
+  cls = {c.__name__: c for c in (BruteForce, UniformGrid, SweepAndPrune, NeighborList, WorldBroadphase)}[args.pop('class')]
+  if args.get('inner') is not None: args['inner'] = from_config(args['inner'])
+  return cls(**args)
+
+class BruteForce(Broadphase):
+  def pairs(self, location: NDArray[DTYPE], radius: NDArray[DTYPE]) -> Pairs:
+    i, j = np.triu_indices(len(location), k=1)
+    return i.astype(np.intp), j.astype(np.intp)
+
+class UniformGrid(Broadphase):
+  # bins bodies into square cells, candidates are bodies in the same or an adjacent cell
+  # cell_size defaults to the largest diameter so every overlapping pair shares or neighbours a cell
+  OFFSETS = ((1, -1), (1, 0), (1, 1), (0, 1))
+
+  def __init__(self, cell_size: float | None=None) -> None:
+    self.cell_size = cell_size
+
+  def config(self) -> dict:
+    return {'class': 'UniformGrid', 'cell_size': self.cell_size}
+
+  def pairs(self, location: NDArray[DTYPE], radius: NDArray[DTYPE]) -> Pairs:
+    n = len(location)
+    if n < 2: return _empty()
+
+    cell = self.cell_size if self.cell_size is not None else 2 * radius.max()
+    if not cell > 0: cell = 1
+    cells = np.floor((location - location.min(axis=0)) / cell).astype(np.int64)
+    cx, cy = cells[:, 0], cells[:, 1]
+    # one spare row so cy-1 and cy+1 never alias into a neighbouring column
+    ny = int(cy.max()) + 2
+    keys = cx * ny + cy
+
+    order = np.argsort(keys, kind='stable').astype(np.intp)
+    skeys = keys[order]
+    scx, scy = cx[order], cy[order]
+
+    # same cell, only bodies sorted after this one
+    hi = np.searchsorted(skeys, skeys, side='right')
+    a, b = _expand(np.arange(1, n + 1, dtype=np.intp), hi)
+    firsts, seconds = [a], [b]
+
+    for dx, dy in self.OFFSETS:
+      nkeys = (scx + dx) * ny + (scy + dy)
+      lo = np.searchsorted(skeys, nkeys, side='left')
+      hi = np.searchsorted(skeys, nkeys, side='right')
+      a, b = _expand(lo, hi)
+      firsts.append(a)
+      seconds.append(b)
+
+    a, b = np.concatenate(firsts), np.concatenate(seconds)
+    return _sorted_pairs(order[a], order[b], n)
+
+class SweepAndPrune(Broadphase):
+  # sorts bodies by the lower edge of their AABB along the widest axis, within strips across the other axis
+  # strips are as tall as the largest AABB, so overlapping bodies share a strip or sit in adjacent ones
+  # and every body only sweeps its own and the next strip, not the whole column a single axis sweep
+  # hands back in a dense pile
+  # the order is kept across steps: verlet bodies barely move per dt, so only the few bodies that
+  # got out of order are sorted again and merged back in
+  # margin grows the AABBs to also catch pairs that get pushed into contact during the same step, which the
+  # sequential resolution needs to match BruteForce, it defaults to a quarter of the largest radius
+  # margin=0 only finds the pairs overlapping at the start of the step
+  def __init__(self, margin: float | None=None) -> None:
+    self.margin = margin
+    self._order: NDArray[np.intp] | None = None
+    self._axis: int = 0
+    self.candidates: int = 0
+    self.saved: int = 0
+    # bodies sorted back in by the last call, n if it sorted from scratch
+    self.moved: int = 0
+
+  def config(self) -> dict:
+    return {'class': 'SweepAndPrune', 'margin': self.margin}
+
+  def invalidate(self) -> None:
+    self._order = None
+
+  def appended(self, location: NDArray[DTYPE], radius: NDArray[DTYPE], start: int) -> None:
+    # new rows go to the end of the order, the next re-sort moves them into place
+    if self._order is None or len(self._order) != start:
+      self._order = None
+      return
+    self._order = np.concatenate((self._order, np.arange(start, len(location), dtype=np.intp)))
+
+  def removed(self, rows: NDArray[np.intp], holes: NDArray[np.intp], movers: NDArray[np.intp]) -> None:
+    if self._order is None: return
+    order = _remap(len(self._order), rows, holes, movers)[self._order]
+    self._order = order[order >= 0]
+
+  def _resort(self, key: NDArray[np.int64]) -> NDArray[np.intp]:
+    # the previous order, sorted by key again
+    # dropping every body with a larger key before it (or a smaller one after it) leaves a sorted run,
+    # the dropped ones are sorted on their own and inserted, whichever drops fewer bodies is used
+    order = self._order
+    assert order is not None
+    k = key[order]
+    ahead = k < np.maximum.accumulate(k)
+    behind = k > np.minimum.accumulate(k[::-1])[::-1]
+    out = ahead if np.count_nonzero(ahead) <= np.count_nonzero(behind) else behind
+    self.moved = int(np.count_nonzero(out))
+    if self.moved == 0: return order
+    if self.moved > len(order) // 4:
+      self.moved = len(order)
+      return order[np.argsort(k, kind='stable')]
+    stay, move = order[~out], order[out]
+    move = move[np.argsort(key[move], kind='stable')]
+    return np.insert(stay, np.searchsorted(key[stay], key[move], side='right'), move)
+
+  # positions along the sweep axis are bucketed into this many steps per strip, keys are (strip << 32) | bucket
+  BUCKETS = 2**31
+
+  def pairs(self, location: NDArray[DTYPE], radius: NDArray[DTYPE]) -> Pairs:
+    n = len(location)
+    if n < 2: return _empty()
+    fresh = self._order is None or len(self._order) != n
+    if fresh: self._axis = int(np.argmax(np.ptp(location, axis=0)))
+    # all arithmetic stays in the store dtype, only the sort keys are integers
+    t = location.dtype.type
+    margin = self.margin if self.margin is not None else 0.25 * float(radius.max())
+    extent = radius + t(margin)
+    sweep, other = location[:, self._axis], location[:, 1 - self._axis]
+    lower, upper = sweep - extent, sweep + extent
+    width = 2 * extent.max()
+    # rounding of the bounds, windows and strips are widened by it and the exact test below drops the extras
+    tol = t(8 * np.finfo(location.dtype).eps * (float(np.abs(location).max()) + float(width)))
+    height = width + tol
+    strip = np.floor((other - other.min()) / height).astype(np.int64) if height > 0 else np.zeros(n, dtype=np.int64)
+
+    # buckets are monotonic in the position, so a bucket window holds every body of the position window
+    base = lower.min() - width - tol
+    scale = t(self.BUCKETS / (float(upper.max() - base) + float(tol) + 1))
+    def bucket(v: NDArray[DTYPE]) -> NDArray[np.int64]:
+      return np.clip(np.floor((v - base) * scale), 0, self.BUCKETS).astype(np.int64)
+    key = strip << 32 | bucket(lower)
+    if fresh:
+      self._order = np.argsort(key, kind='stable').astype(np.intp)
+      self.moved = n
+    else:
+      self._order = self._resort(key)
+    order = self._order
+
+    # windows are found and filtered on the sorted arrays, only the survivors are mapped back to rows
+    skey, sstrip = key[order], strip[order]
+    ssweep, sother, sextent = sweep[order], other[order], extent[order]
+    end = bucket(ssweep + sextent + tol)
+    # own strip: bodies sorted after this one that start before it ends
+    hi = np.searchsorted(skey, sstrip << 32 | end, side='right')
+    a, b = _expand(np.arange(1, n + 1, dtype=np.intp), hi)
+    # next strip: bodies that start before this one ends and at most one AABB width before it starts
+    nxt = (sstrip + 1) << 32
+    lo = np.searchsorted(skey, nxt | bucket(ssweep - sextent - width - tol), side='left')
+    hi = np.searchsorted(skey, nxt | end, side='right')
+    a2, b2 = _expand(lo, hi)
+    a, b = np.concatenate((a, a2)), np.concatenate((b, b2))
+
+    reach = sextent[a] + sextent[b]
+    keep = (np.abs(ssweep[a] - ssweep[b]) <= reach) & (np.abs(sother[a] - sother[b]) <= reach)
+    a, b = order[a[keep]], order[b[keep]]
+
+    self.candidates = len(a)
+    self.saved = n * (n - 1) // 2 - self.candidates
+    return _sorted_pairs(a, b, n)
+
+class NeighborList(Broadphase):
+  # caches every pair closer than r_i + r_j + skin and only rebuilds once some body
+  # moved more than skin/2 since the last build, between rebuilds the cached pairs are returned
+  # inner builds the list from radii inflated by skin/2
+  # rows appended at once beyond this rebuild the list, checking each of them against every row costs more
+  APPEND_LIMIT = 32
+
+  def __init__(self, skin: float, inner: Broadphase | None=None) -> None:
+    assert skin > 0, 'skin must be > 0'
+    self.skin = skin
+    self.inner: Broadphase = inner if inner is not None else UniformGrid()
+    self._pairs: Pairs = _empty()
+    self._reference: NDArray[DTYPE] | None = None
+    self._counts: NDArray[np.intp] = np.empty(0, dtype=np.intp)
+    self.rebuilds: int = 0
+    self.calls: int = 0
+
+  def config(self) -> dict:
+    return {'class': 'NeighborList', 'skin': self.skin, 'inner': self.inner.config()}
+
+  def invalidate(self) -> None:
+    self._reference = None
+    self.inner.invalidate()
+
+  def appended(self, location: NDArray[DTYPE], radius: NDArray[DTYPE], start: int) -> None:
+    self.inner.appended(location, radius + self.skin / 2, start)
+    n, k = len(location), len(location) - start
+    if self._reference is None or len(self._reference) != start or k > self.APPEND_LIMIT:
+      self._reference = None
+      return
+    # new rows are measured from where they are now, old rows from their reference location,
+    # so a pair missing from the list can't close the distance before needs_rebuild catches it
+    reference = np.concatenate((self._reference, location[start:]))
+    dx = reference[None, :, 0] - reference[start:, 0, None]
+    dy = reference[None, :, 1] - reference[start:, 1, None]
+    reach = radius[None, :] + (radius[start:, None] + self.skin)
+    close = dx*dx + dy*dy < reach * reach
+    close &= np.arange(n)[None, :] < np.arange(start, n)[:, None]
+    new, old = np.nonzero(close)
+    self._pairs = _merge_pairs(self._pairs, _sorted_pairs(old.astype(np.intp), (new + start).astype(np.intp), n))
+    self._reference = reference
+    self._counts = np.bincount(np.concatenate(self._pairs), minlength=n)
+
+  def removed(self, rows: NDArray[np.intp], holes: NDArray[np.intp], movers: NDArray[np.intp]) -> None:
+    self.inner.removed(rows, holes, movers)
+    if self._reference is None: return
+    n = len(self._reference)
+    end = n - len(rows)
+    i, j = self._pairs
+    remap = _remap(n, rows, holes, movers)
+    ri, rj = remap[i], remap[j]
+    keep = (ri >= 0) & (rj >= 0)
+    # pairs of rows that didn't move keep their order, the rest are sorted in
+    moved = keep & ((i >= end) | (j >= end))
+    keep &= ~moved
+    self._pairs = _merge_pairs((ri[keep], rj[keep]), _sorted_pairs(ri[moved], rj[moved], end))
+    self._reference[holes] = self._reference[movers]
+    self._reference = self._reference[:end]
+    self._counts = np.bincount(np.concatenate(self._pairs), minlength=end)
+
+  def needs_rebuild(self, location: NDArray[DTYPE]) -> bool:
+    if self._reference is None or len(self._reference) != len(location): return True
+    if len(location) == 0: return False
+    moved = np.einsum('ij,ij->i', location - self._reference, location - self._reference)
+    return bool(moved.max() > (self.skin / 2) ** 2)
+
+  def build(self, location: NDArray[DTYPE], radius: NDArray[DTYPE]) -> None:
+    i, j = self.inner.pairs(location, radius + self.skin / 2)
+    d = location[i] - location[j]
+    reach = radius[i] + radius[j] + self.skin
+    keep = np.einsum('ij,ij->i', d, d) < reach * reach
+    self._pairs = i[keep], j[keep]
+    self._reference = location.copy()
+    self._counts = np.bincount(np.concatenate(self._pairs), minlength=len(location))
+    self.rebuilds += 1
+
+  def pairs(self, location: NDArray[DTYPE], radius: NDArray[DTYPE]) -> Pairs:
+    self.calls += 1
+    if self.needs_rebuild(location):
+      self.build(location, radius)
+    return self._pairs
+
+  def neighbors(self, i: int) -> NDArray[np.intp]:
+    first, second = self._pairs
+    return np.concatenate((second[first == i], first[second == i]))
+
+  @property
+  def size(self) -> int:
+    return len(self._pairs[0])
+
+  @property
+  def max_neighbors(self) -> int:
+    return int(self._counts.max()) if len(self._counts) else 0
+
+  @property
+  def mean_neighbors(self) -> float:
+    return float(self._counts.mean()) if len(self._counts) else 0.0
+
+  @property
+  def rebuild_rate(self) -> float:
+    return self.rebuilds / self.calls if self.calls else 0.0
+
+class WorldBroadphase(Broadphase):
+  # pairs for `worlds` independent copies of a scene stored back to back, never pairs bodies of two worlds
+  # without inner every pair inside a world is a candidate, otherwise the worlds are laid out
+  # side by side along x, far enough apart that inner can't pair across them
+  def __init__(self, worlds: int, inner: Broadphase | None=None) -> None:
+    assert worlds >= 1, 'worlds must be >= 1'
+    self.worlds = worlds
+    self.inner = inner
+
+  def config(self) -> dict:
+    return {'class': 'WorldBroadphase', 'worlds': self.worlds, 'inner': self.inner and self.inner.config()}
+
+  def invalidate(self) -> None:
+    if self.inner is not None: self.inner.invalidate()
+
+  def pairs(self, location: NDArray[DTYPE], radius: NDArray[DTYPE]) -> Pairs:
+    n = len(location) // self.worlds
+    if n < 2: return _empty()
+    if self.inner is None:
+      i, j = np.triu_indices(n, k=1)
+      offset = (np.arange(self.worlds, dtype=np.intp) * n)[:, None]
+      return (i + offset).ravel(), (j + offset).ravel()
+
+    span = np.ptp(location[:, 0]) + 4 * radius.max() + 1
+    shifted = location.copy()
+    shifted[:, 0] += np.repeat(np.arange(self.worlds, dtype=DTYPE) * span, n)
+    return self.inner.pairs(shifted, radius)
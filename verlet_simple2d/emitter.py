@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+  from verlet_simple2d.space import Space
+
+
+class Emitter:
+  # spawns `rate` circles per second at uniform positions in the rectangle (x, y, width, height)
+  # velocities are in units per second, velocity plus a normal distributed spread per component
+  def __init__(
+    self, x: float, y: float, rate: float, radius: float, width: float=0, height: float=0,
+    velocity: tuple[float, float]=(0, 0), spread: float=0, mass: float=1, collision_type: int | None=None,
+    seed: int | None=None,
+  ) -> None:
+    assert rate >= 0, 'rate must be >= 0'
+    self.x, self.y, self.width, self.height = x, y, width, height
+    self.rate = rate
+    self.radius = radius
+    self.velocity = np.asarray(velocity, dtype=np.float64)
+    self.spread = spread
+    self.mass = mass
+    self.collision_type = collision_type
+    self.emitted: int = 0
+    self._rng = np.random.default_rng(seed)
+    # fractional bodies owed from earlier steps
+    self._carry: float = 0.0
+
+  def emit(self, space: Space) -> None:
+    self._carry += self.rate * float(space.dt)
+    k = int(self._carry)
+    if k == 0: return
+    self._carry -= k
+    rng = self._rng
+    x = self.x + rng.uniform(0, 1, k) * self.width
+    y = self.y + rng.uniform(0, 1, k) * self.height
+    velocity = self.velocity + rng.normal(0, self.spread, (k, 2)) if self.spread else np.broadcast_to(self.velocity, (k, 2))
+    space.add_circles(x, y, self.radius, velocity=velocity * space.dt, mass=self.mass, collision_type=self.collision_type)
+    self.emitted += k
+
+class Sink:
+  # removes every body whose center is inside the rectangle (x, y, width, height)
+  def __init__(self, x: float, y: float, width: float, height: float) -> None:
+    self.x, self.y, self.width, self.height = x, y, width, height
+    self.absorbed: int = 0
+
+  def absorb(self, space: Space) -> None:
+    loc = space.bodies.location
+    inside = np.flatnonzero(
+      (loc[:, 0] >= self.x) & (loc[:, 0] <= self.x + self.width)
+      & (loc[:, 1] >= self.y) & (loc[:, 1] <= self.y + self.height)
+    )
+    if len(inside):
+      space.remove_bodies(inside)
+      self.absorbed += len(inside)
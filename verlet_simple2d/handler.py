@@ -6,18 +6,22 @@ import numpy as np
 from numpy.typing import NDArray
 
 from verlet_simple2d import DTYPE, helpers, shapes
+from verlet_simple2d.store import BodyStore
 
 
 def get_handler(X: shapes.Body | shapes.Border, Y: shapes.Body | shapes.Border) -> CollisionHandler:
-  assert not (isinstance(X, shapes.Border) and isinstance(Y, shapes.Border)), 'X and Y cannot both be a border'
+  return get_handler_for_types(type(X), X.collision_type, type(Y), Y.collision_type)
 
-  match type(X), type(Y):
+def get_handler_for_types(type_x: type, collision_type_x, type_y: type, collision_type_y) -> CollisionHandler:
+  assert not (issubclass(type_x, shapes.Border) and issubclass(type_y, shapes.Border)), 'X and Y cannot both be a border'
+
+  match type_x, type_y:
     case (shapes.Circle, shapes.CircleBorder) | (shapes.CircleBorder, shapes.Circle):
-      return CircleCircleBorderHandler((X.collision_type, Y.collision_type))
+      return CircleCircleBorderHandler((collision_type_x, collision_type_y))
     case (shapes.Circle, shapes.Circle):
-      return CircleCircleHandler((X.collision_type, Y.collision_type))
+      return CircleCircleHandler((collision_type_x, collision_type_y))
     case (shapes.Circle, shapes.RectangleBorder) | (shapes.RectangleBorder, shapes.Circle):
-      return CircleRectangleBorderHandler((X.collision_type, Y.collision_type))
+      return CircleRectangleBorderHandler((collision_type_x, collision_type_y))
   raise NotImplementedError()
 
 class CollisionHandler:
@@ -33,16 +37,38 @@ class CollisionHandler:
   @abstractmethod
   def resolve(self, X, Y) -> None: pass
 
+  # batch variants work on index arrays into a BodyStore, Y is either a second index array or a border
+  # the pairs given to resolve_batch never share a body, so they can be written back at once
+  def _batch_objects(self, store: BodyStore, i: NDArray[np.intp], Y: NDArray[np.intp] | shapes.Border) -> list[tuple]:
+    handles = store.materialize()
+    if isinstance(Y, shapes.Border):
+      return [(handles[a], Y) for a in i.tolist()]
+    return [(handles[a], handles[b]) for a, b in zip(i.tolist(), Y.tolist())]
+
+  def check_batch(self, store: BodyStore, i: NDArray[np.intp], Y: NDArray[np.intp] | shapes.Border) -> NDArray[np.bool_]:
+    return np.array([bool(self.check(X, Z)) for X, Z in self._batch_objects(store, i, Y)], dtype=np.bool_)
+
+  def resolve_batch(self, store: BodyStore, i: NDArray[np.intp], Y: NDArray[np.intp] | shapes.Border) -> None:
+    for X, Z in self._batch_objects(store, i, Y):
+      self.resolve(X, Z)
+
 class CircleCircleHandler(CollisionHandler):
   def __init__(self, types=(shapes.Circle, shapes.Circle)) -> None:
     super().__init__(types)
 
+  # check and resolve read the store rows behind the handles directly, the properties cost more than the math
   def check(self, X: shapes.Circle, Y:shapes.Circle) -> bool:
-    return bool(np.linalg.norm(X.location - Y.location) < X.radius + Y.radius)
+    sX, iX, sY, iY = X._store, X._index, Y._store, Y._index
+    # sqrt(d.dot(d)) is what np.linalg.norm computes for a vector, without its dispatch
+    d = sX._location[iX] - sY._location[iY]
+    return bool(np.sqrt(d.dot(d)) < sX._radius[iX] + sY._radius[iY])
   
   def resolve(self, X: shapes.Circle, Y: shapes.Circle) -> None:
-    vX = X.location - X.prev_location
-    vY = Y.location - Y.prev_location
+    sX, iX, sY, iY = X._store, X._index, Y._store, Y._index
+    # row views, writing into them writes the store
+    lX, lY = sX._location[iX], sY._location[iY]
+    vX = lX - sX._prev_location[iX]
+    vY = lY - sY._prev_location[iY]
 
     """
     g1 = X.prev_x - Y.prev_x
@@ -74,19 +100,20 @@ class CircleCircleHandler(CollisionHandler):
     """
 
     # commented out code should be significantly better, but not sure if it's working properly 100% of the time
-    d_vec = X.location - Y.location
+    d_vec = lX - lY
     d = np.linalg.norm(d_vec)
     d_vec = d_vec/d
-    d_vec = d_vec * ((X.radius + Y.radius) - d)
-    X.location += d_vec * 0.5
-    Y.location -= d_vec * 0.5
+    d_vec = d_vec * ((sX._radius[iX] + sY._radius[iY]) - d)
+    lX += d_vec * 0.5
+    lY -= d_vec * 0.5
     #END
 
 
     #tmp_v1 = c1.velocity - (2*c2.mass/(c1.mass+c2.mass)) * (np.dot(c1.velocity-c2.velocity, c1.loc-c2.loc) / np.linalg.norm(c1.loc-c2.loc)**2) * (c1.loc-c2.loc)
     #tmp_v2 = c2.velocity - (2*c1.mass/(c2.mass+c1.mass)) * (np.dot(c2.velocity-c1.velocity, c2.loc-c1.loc) / np.linalg.norm(c2.loc-c1.loc)**2) * (c2.loc-c1.loc)
-    tmp_vX =  vX - (2*X.mass/(X.mass+Y.mass)) * (np.dot(vX-vY, X.location - Y.location) / np.linalg.norm(X.location-Y.location)**2) * (X.location-Y.location)
-    tmp_vY =  vY - (2*Y.mass/(Y.mass+X.mass)) * (np.dot(vY-vX, Y.location - X.location) / np.linalg.norm(Y.location-X.location)**2) * (Y.location-X.location)
+    mX, mY = sX._mass[iX], sY._mass[iY]
+    tmp_vX =  vX - (2*mX/(mX+mY)) * (np.dot(vX-vY, lX - lY) / np.linalg.norm(lX-lY)**2) * (lX-lY)
+    tmp_vY =  vY - (2*mY/(mY+mX)) * (np.dot(vY-vX, lY - lX) / np.linalg.norm(lY-lX)**2) * (lY-lX)
 
     tmp_vX[np.isnan(tmp_vX) | np.isinf(tmp_vX)] = DTYPE(0)
     tmp_vY[np.isnan(tmp_vY) | np.isinf(tmp_vY)] = DTYPE(0)
@@ -96,50 +123,181 @@ class CircleCircleHandler(CollisionHandler):
     Y.location += tmp_vY * (1-t)
     """
 
-    X.prev_location = X.location + (-tmp_vX)
-    Y.prev_location = Y.location + (-tmp_vY)
+    sX._prev_location[iX] = lX + (-tmp_vX)
+    sY._prev_location[iY] = lY + (-tmp_vY)
 
-    X._collisions+=1
-    Y._collisions+=1
+    sX._collisions[iX] += 1
+    sY._collisions[iY] += 1
+
+  def check_batch(self, store: BodyStore, i: NDArray[np.intp], j) -> NDArray[np.bool_]:
+    d = store._location[i] - store._location[j]
+    return np.sqrt(np.einsum('ij,ij->i', d, d)) < store._radius[i] + store._radius[j]
+
+  def resolve_batch(self, store: BodyStore, i: NDArray[np.intp], j) -> None:
+    # same math as resolve, for every pair at once
+    loc, prev = store._location, store._prev_location
+    lX, lY = loc[i], loc[j]
+    vX = lX - prev[i]
+    vY = lY - prev[j]
+
+    d_vec = lX - lY
+    d = np.sqrt(np.einsum('ij,ij->i', d_vec, d_vec))[:, None]
+    d_vec = d_vec/d
+    d_vec = d_vec * ((store._radius[i] + store._radius[j])[:, None] - d)
+    lX += d_vec * 0.5
+    lY -= d_vec * 0.5
+
+    mX, mY = store._mass[i][:, None], store._mass[j][:, None]
+    diff = lX - lY
+    dist2 = np.einsum('ij,ij->i', diff, diff)[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+      tmp_vX = vX - (2*mX/(mX+mY)) * (np.einsum('ij,ij->i', vX-vY, diff)[:, None] / dist2) * diff
+      tmp_vY = vY - (2*mY/(mY+mX)) * (np.einsum('ij,ij->i', vY-vX, -diff)[:, None] / dist2) * (-diff)
+
+    tmp_vX[~np.isfinite(tmp_vX)] = DTYPE(0)
+    tmp_vY[~np.isfinite(tmp_vY)] = DTYPE(0)
+
+    loc[i] = lX
+    loc[j] = lY
+    prev[i] = lX - tmp_vX
+    prev[j] = lY - tmp_vY
+
+    store._collisions[i] += 1
+    store._collisions[j] += 1
+
+class SweptCircleCircleHandler(CircleCircleHandler):
+  # continuous collision detection: pairs also collide if their paths from prev_location to location
+  # cross within the step, those are resolved at the time of impact instead of pushed apart at the end,
+  # so fast circles can't tunnel through each other at large dt
+  # pairs that already overlapped at the start of the step fall back to the plain push out
+  def _impact(self, store: BodyStore, i: NDArray[np.intp], j: NDArray[np.intp]) -> NDArray[DTYPE]:
+    # first t in [0, 1] at which the circles touch moving along their step, nan if they don't or overlapped at 0
+    loc, prev = store._location, store._prev_location
+    g = prev[i] - prev[j]
+    h = (loc[i] - prev[i]) - (loc[j] - prev[j])
+    R = store._radius[i] + store._radius[j]
+    a = np.einsum('ij,ij->i', h, h)
+    b = 2 * np.einsum('ij,ij->i', g, h)
+    c = np.einsum('ij,ij->i', g, g) - R*R
+    with np.errstate(divide='ignore', invalid='ignore'):
+      t = (-b - np.sqrt(b*b - 4*a*c)) / (2*a)
+    return np.where((c > 0) & (t >= 0) & (t <= 1), t, np.nan)
+
+  def check(self, X: shapes.Circle, Y: shapes.Circle) -> bool:
+    return bool(self.check_batch(X._store, np.array([X._index]), np.array([Y._index]))[0])
+
+  def resolve(self, X: shapes.Circle, Y: shapes.Circle) -> None:
+    self.resolve_batch(X._store, np.array([X._index]), np.array([Y._index]))
+
+  def check_batch(self, store: BodyStore, i: NDArray[np.intp], j) -> NDArray[np.bool_]:
+    return super().check_batch(store, i, j) | ~np.isnan(self._impact(store, i, j))
+
+  def resolve_batch(self, store: BodyStore, i: NDArray[np.intp], j) -> None:
+    t = self._impact(store, i, j)
+    swept = ~np.isnan(t)
+    if not swept.all():
+      super().resolve_batch(store, i[~swept], j[~swept])
+    if not swept.any(): return
+    i, j, t = i[swept], j[swept], t[swept, None]
+
+    loc, prev = store._location, store._prev_location
+    vX = loc[i] - prev[i]
+    vY = loc[j] - prev[j]
+    pX = prev[i] + vX*t
+    pY = prev[j] + vY*t
+
+    # same velocity exchange as resolve, at the point of impact
+    mX, mY = store._mass[i][:, None], store._mass[j][:, None]
+    diff = pX - pY
+    dist2 = np.einsum('ij,ij->i', diff, diff)[:, None]
+    tmp_vX = vX - (2*mX/(mX+mY)) * (np.einsum('ij,ij->i', vX-vY, diff)[:, None] / dist2) * diff
+    tmp_vY = vY - (2*mY/(mY+mX)) * (np.einsum('ij,ij->i', vY-vX, -diff)[:, None] / dist2) * (-diff)
+
+    lX = pX + tmp_vX*(1-t)
+    lY = pY + tmp_vY*(1-t)
+    loc[i] = lX
+    loc[j] = lY
+    prev[i] = lX - tmp_vX
+    prev[j] = lY - tmp_vY
+
+    store._collisions[i] += 1
+    store._collisions[j] += 1
 
 class CircleCircleBorderHandler(CollisionHandler):
   def __init__(self, types=(shapes.Circle, shapes.CircleBorder)) -> None:
     super().__init__(types)
 
   def check(self, X: shapes.Circle, Y: shapes.CircleBorder) -> bool:
-    d = np.linalg.norm(X.location - Y.location)
-    if d >= Y.radius - X.radius:
+    sX, iX = X._store, X._index
+    r = sX._radius[iX]
+    d = sX._location[iX] - Y._location
+    d = np.sqrt(d.dot(d))
+    if d >= Y._radius - r:
       return True
-    if d > Y.radius + Y.line_width + X.radius:
+    if d > Y._radius + Y.line_width + r:
       return True
     return False
   
   def resolve(self, X: shapes.Circle, Y: shapes.CircleBorder) -> None:
-    x_vel = X.location - X.prev_location
-    X.location = helpers.closest_point(
-      X.location,
+    sX, iX = X._store, X._index
+    loc, prev = sX._location[iX], sX._prev_location[iX]
+    x_vel = loc - prev
+    loc[:] = helpers.closest_point(
+      loc,
       helpers.line_circle_intersection(
-        Y.location,
-        Y.radius - X.radius,
-        X.location,
+        Y._location,
+        Y._radius - sX._radius[iX],
+        loc,
         x_vel,
       )
     )
 
-    t = np.linalg.norm(X.prev_location - X.location)/np.linalg.norm(x_vel)
+    t = np.linalg.norm(prev - loc)/np.linalg.norm(x_vel)
 
     assert t <= 1, f't must be < 1, but is {t}'
 
-    mirror_vec = Y.location - X.location
+    mirror_vec = Y._location - loc
     mirror_vec = mirror_vec/np.linalg.norm(mirror_vec)
 
     x_vel -= 2*np.dot(x_vel, mirror_vec)*mirror_vec
 
-    X.location += (1-t)*x_vel
-    X.prev_location = X.location + (-x_vel)
+    loc += (1-t)*x_vel
+    prev[:] = loc + (-x_vel)
+
+    sX._collisions[iX] += 1
+    Y._collisions += 1
+
+  def check_batch(self, store: BodyStore, i: NDArray[np.intp], Y) -> NDArray[np.bool_]:
+    d = store._location[i] - Y.location
+    return np.sqrt(np.einsum('ij,ij->i', d, d)) >= Y.radius - store._radius[i]
+
+  def resolve_batch(self, store: BodyStore, i: NDArray[np.intp], Y) -> None:
+    loc, prev = store._location[i], store._prev_location[i]
+    inner = Y.radius - store._radius[i]
+    x_vel = loc - prev
+    new_loc = helpers.closest_point_batch(loc, *helpers.line_circle_intersection_batch(Y.location, inner, loc, x_vel))
+
+    # not moving or not crossing the inner circle, push straight back in
+    stuck = np.isnan(new_loc).any(axis=1)
+    if stuck.any():
+      out = loc[stuck] - Y.location
+      new_loc[stuck] = Y.location + out / np.linalg.norm(out, axis=1)[:, None] * inner[stuck, None]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+      t = np.linalg.norm(prev - new_loc, axis=1) / np.linalg.norm(x_vel, axis=1)
+    t[stuck] = 1
 
-    X._collisions+=1
-    Y._collisions+=1
+    mirror_vec = Y.location - new_loc
+    mirror_vec = mirror_vec / np.linalg.norm(mirror_vec, axis=1)[:, None]
+
+    x_vel -= 2*np.einsum('ij,ij->i', x_vel, mirror_vec)[:, None]*mirror_vec
+
+    new_loc += (1-t)[:, None]*x_vel
+    store._location[i] = new_loc
+    store._prev_location[i] = new_loc - x_vel
+
+    store._collisions[i] += 1
+    Y._collisions += len(i)
 
 class CircleRectangleBorderHandler(CollisionHandler):
   def __init__(self, types=(shapes.Circle, shapes.RectangleBorder)) -> None:
@@ -147,15 +305,18 @@ class CircleRectangleBorderHandler(CollisionHandler):
 
   def closest_side(self, X: shapes.Circle, Y: shapes.RectangleBorder) -> tuple[NDArray[DTYPE], DTYPE]:
     vf, hf = DTYPE(0), DTYPE(0)
-    distance_upper = Y.y + Y.height - (X.y + X.radius)
-    distance_lower = (X.y - X.radius) - Y.y
+    x, y = X._store._location[X._index]
+    r = X._store._radius[X._index]
+    (bx, by), (width, height) = Y._location, Y._dims
+    distance_upper = by + height - (y + r)
+    distance_lower = (y - r) - by
     if distance_lower < distance_upper:
       vertical_distance = distance_lower 
     else:
       vertical_distance = distance_upper
       vf = DTYPE(1)
-    distance_right = Y.x + Y.width - (X.x + X.radius)
-    distance_left = (X.x - X.radius) - Y.x
+    distance_right = bx + width - (x + r)
+    distance_left = (x - r) - bx
     if distance_right < distance_left:
       horizontal_distance = distance_right
       hf = DTYPE(1)
@@ -166,36 +327,96 @@ class CircleRectangleBorderHandler(CollisionHandler):
       return np.array((1,0)), vf
     return np.array((0,1)), hf
   
+  def closest_side_batch(self, store: BodyStore, i: NDArray[np.intp], Y: shapes.RectangleBorder) -> tuple[NDArray[DTYPE], NDArray[DTYPE]]:
+    x, y, r = store._location[i, 0], store._location[i, 1], store._radius[i]
+    distance_upper = Y.y + Y.height - (y + r)
+    distance_lower = (y - r) - Y.y
+    lower = distance_lower < distance_upper
+    vertical_distance = np.where(lower, distance_lower, distance_upper)
+    vf = np.where(lower, DTYPE(0), DTYPE(1))
+    distance_right = Y.x + Y.width - (x + r)
+    distance_left = (x - r) - Y.x
+    right = distance_right < distance_left
+    horizontal_distance = np.where(right, distance_right, distance_left)
+    hf = np.where(right, DTYPE(1), DTYPE(0))
+
+    vertical = vertical_distance < horizontal_distance
+    mirror_vec = np.where(vertical[:, None], np.array((1, 0), dtype=DTYPE), np.array((0, 1), dtype=DTYPE))
+    return mirror_vec, np.where(vertical, vf, hf)
+
   def check(self, X: shapes.Circle, Y: shapes.RectangleBorder):
+    x, y = X._store._location[X._index]
+    r = X._store._radius[X._index]
+    (bx, by), (width, height) = Y._location, Y._dims
     if (
-      X.y + X.radius > Y.y + Y.height
-      or X.y - X.radius < Y.y
-      or X.x + X.radius > Y.x + Y.width
-      or X.x - X.radius < Y.x
+      y + r > by + height
+      or y - r < by
+      or x + r > bx + width
+      or x - r < bx
     ):
       return True
 
   def resolve(self, X: shapes.Circle, Y: shapes.RectangleBorder) -> None:
-    vel = X.location - X.prev_location
+    sX, iX = X._store, X._index
+    loc, prev, r = sX._location[iX], sX._prev_location[iX], sX._radius[iX]
+    vel = loc - prev
 
     mirror_vec,f = self.closest_side(X, Y)
-    mirror_line_point = (Y.location + X.radius) + (f * (Y.dims - 2*X.radius))
+    mirror_line_point = (Y._location + r) + (f * (Y._dims - 2*r))
 
-    X.location = helpers.line_line_intersection(
-      X.location,
+    loc[:] = helpers.line_line_intersection(
+      loc,
       vel,
       mirror_line_point,
       mirror_vec,
     )
 
-    t = np.linalg.norm(X.prev_location - X.location)/np.linalg.norm(vel)
+    t = np.linalg.norm(prev - loc)/np.linalg.norm(vel)
 
     #assert t <= 1, f't must be < 1, but is {t}'
 
     vel -= 2*np.dot(vel, mirror_vec[::-1])*mirror_vec[::-1]
 
-    X.location += (1-t)*vel
-    X.prev_location = X.location + (-vel)
+    loc += (1-t)*vel
+    prev[:] = loc + (-vel)
+
+    sX._collisions[iX] += 1
+    Y._collisions += 1
+
+  def check_batch(self, store: BodyStore, i: NDArray[np.intp], Y) -> NDArray[np.bool_]:
+    x, y, r = store._location[i, 0], store._location[i, 1], store._radius[i]
+    return (
+      (y + r > Y.y + Y.height)
+      | (y - r < Y.y)
+      | (x + r > Y.x + Y.width)
+      | (x - r < Y.x)
+    )
+
+  def resolve_batch(self, store: BodyStore, i: NDArray[np.intp], Y) -> None:
+    loc, prev, r = store._location[i], store._prev_location[i], store._radius[i, None]
+    vel = loc - prev
+
+    mirror_vec, f = self.closest_side_batch(store, i, Y)
+    mirror_line_point = (Y.location + r) + (f[:, None] * (Y.dims - 2*r))
+
+    new_loc = helpers.line_line_intersection_batch(loc, vel, mirror_line_point, mirror_vec)
+
+    # moving parallel to the side (or not at all), put it back on the side
+    stuck = np.isnan(new_loc).any(axis=1)
+    if stuck.any():
+      normal = mirror_vec[stuck, ::-1]
+      new_loc[stuck] = loc[stuck] * (1 - normal) + mirror_line_point[stuck] * normal
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+      t = np.linalg.norm(prev - new_loc, axis=1) / np.linalg.norm(vel, axis=1)
+    t[stuck] = 1
+
+    normal = mirror_vec[:, ::-1]
+    vel -= 2*np.einsum('ij,ij->i', vel, normal)[:, None]*normal
+
+    new_loc += (1-t)[:, None]*vel
+    store._location[i] = new_loc
+    store._prev_location[i] = new_loc - vel
 
-    X._collisions+=1
-    Y._collisions+=1
+    store._collisions[i] += 1
+    Y._collisions += len(i)
@@ -12,6 +12,15 @@ def fmt_asrt(name: str, types: Any | tuple[Any, ...]) -> str:
     return f'{name} should be of types {[e.__name__ for e in types]}'
   return f'{name} should be of type {types}'
 
+def subclasses(cls: type) -> list[type]:
+  # every direct and indirect subclass
+  found: list[type] = []
+  sub: type
+  for sub in cls.__subclasses__():
+    found.append(sub)
+    found.extend(subclasses(sub))
+  return found
+
 def closest_point(point: NDArray[DTYPE], points: list[NDArray[DTYPE]]) -> NDArray[DTYPE]:
   if len(points) == 0: raise ValueError('points must be of length >0')
   if len(points) == 1: return points[0]
@@ -54,3 +63,72 @@ def line_circle_intersection(
   point1 = line_point + t1 * line_vector
   point2 = line_point + t2 * line_vector
   return [point1, point2]
+
+# batch versions take one row per line, rows without a solution come back as nan
+def closest_point_batch(point: NDArray[DTYPE], points1: NDArray[DTYPE], points2: NDArray[DTYPE]) -> NDArray[DTYPE]:
+  d1 = np.einsum('ij,ij->i', point - points1, point - points1)
+  d2 = np.einsum('ij,ij->i', point - points2, point - points2)
+  return np.where((d1 < d2)[:, None] | np.isnan(d2)[:, None], points1, points2)
+
+def line_line_intersection_batch(
+  p1: NDArray[DTYPE], v1: NDArray[DTYPE],
+  p2: NDArray[DTYPE], v2: NDArray[DTYPE]
+) -> NDArray[DTYPE]:
+  x1, y1 = p1[..., 0], p1[..., 1]
+  x2, y2 = p2[..., 0], p2[..., 1]
+  vx1, vy1 = v1[..., 0], v1[..., 1]
+  vx2, vy2 = v2[..., 0], v2[..., 1]
+
+  det = vx1 * vy2 - vx2 * vy1
+  with np.errstate(divide='ignore', invalid='ignore'):
+    t = ((x2 - x1) * vy2 - (y2 - y1) * vx2) / det
+  t = np.where(det == 0, np.nan, t)
+  return np.stack((x1 + t * vx1, y1 + t * vy1), axis=-1)
+
+def line_circle_intersection_batch(
+    circle_center: NDArray[DTYPE], circle_radius: NDArray[DTYPE],
+    line_point: NDArray[DTYPE], line_vector: NDArray[DTYPE],
+) -> tuple[NDArray[DTYPE], NDArray[DTYPE]]:
+  a = line_vector[:, 0]**2 + line_vector[:, 1]**2
+  b = 2 * (line_vector[:, 0] * (line_point[:, 0] - circle_center[..., 0]) + line_vector[:, 1] * (line_point[:, 1] - circle_center[..., 1]))
+  c = (line_point[:, 0] - circle_center[..., 0])**2 + (line_point[:, 1] - circle_center[..., 1])**2 - circle_radius**2
+
+  discriminant = b**2 - 4*a*c
+  with np.errstate(divide='ignore', invalid='ignore'):
+    root = np.sqrt(np.where(discriminant < 0, np.nan, discriminant))
+    t1 = (-b + root) / (2*a)
+    t2 = (-b - root) / (2*a)
+  point1 = line_point + t1[:, None] * line_vector
+  point2 = line_point + t2[:, None] * line_vector
+  return point1, point2
+
+def pair_colors(
+  i: NDArray[np.intp], j: NDArray[np.intp], n: int,
+  ids: NDArray[np.intp] | None=None,
+) -> NDArray[np.intp]:
+  # greedy graph coloring of pairs, no two pairs of the same color share a body
+  # every pass takes the pairs whose priority is the lowest among all remaining pairs touching
+  # either of their bodies, priorities are a hash of the body ids so long chains don't serialize
+  m = len(i)
+  color = np.full(m, -1, dtype=np.intp)
+  if m == 0: return color
+  key_i, key_j = (i, j) if ids is None else (ids[i], ids[j])
+  with np.errstate(over='ignore'):
+    h = key_i.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15) ^ key_j.astype(np.uint64) * np.uint64(0xC2B2AE3D27D4EB4F)
+  rank = np.empty(m, dtype=np.intp)
+  rank[np.argsort(h, kind='stable')] = np.arange(m, dtype=np.intp)
+
+  best = np.empty(n, dtype=np.intp)
+  remaining = np.arange(m, dtype=np.intp)
+  c = 0
+  while len(remaining):
+    ri, rj, rr = i[remaining], j[remaining], rank[remaining]
+    best[ri] = m
+    best[rj] = m
+    np.minimum.at(best, ri, rr)
+    np.minimum.at(best, rj, rr)
+    sel = (best[ri] == rr) & (best[rj] == rr)
+    color[remaining[sel]] = c
+    remaining = remaining[~sel]
+    c += 1
+  return color
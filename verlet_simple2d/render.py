@@ -1,18 +1,199 @@
 import platform
 import random
 import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from pathlib import Path
-from typing import cast
+from typing import Iterator, NamedTuple, cast
 
 import ffmpeg  # type: ignore[import-untyped]
 import matplotlib.pyplot as plt
+import numpy as np
+from numpy.typing import NDArray
 from PIL import Image, ImageDraw, ImageFont
-from tqdm import trange
+from tqdm import tqdm
 
 from verlet_simple2d import DTYPE, shapes
 from verlet_simple2d.space import Space
+from verlet_simple2d.store import type_id
+from verlet_simple2d.trajectory import Trajectory
 
 
+class FrameSnapshot(NamedTuple):
+  # what a frame needs from the simulation, copied so the space can keep stepping
+  location: NDArray[DTYPE]
+  radius: NDArray[DTYPE]
+  color: NDArray[np.uint8]
+
+def stamp_circles(
+  x0: NDArray, y0: NDArray, x1: NDArray, y1: NDArray, width: int, height: int,
+) -> NDArray[np.int32]:
+  # index of the topmost (last) circle covering each pixel of a height x width image, -1 where none
+  # circles are the ellipses inscribed in the truncated, inclusive pixel boxes, like ImageDraw.ellipse
+  # the covered offsets only depend on the box size, so each size class is stamped with one precomputed mask
+  owner = np.full(width * height, -1, dtype=np.int32)
+  bx0, by0 = np.floor(x0).astype(np.int64), np.floor(y0).astype(np.int64)
+  bw, bh = np.floor(x1).astype(np.int64) - bx0 + 1, np.floor(y1).astype(np.int64) - by0 + 1
+  visible = (bx0 < width) & (by0 < height) & (bx0 + bw > 0) & (by0 + bh > 0) & (bw > 0) & (bh > 0)
+  clipped = (bx0 < 0) | (by0 < 0) | (bx0 + bw > width) | (by0 + bh > height)
+  sizes, size_class = np.unique(np.stack((bw[visible], bh[visible]), axis=1), axis=0, return_inverse=True)
+  members = np.flatnonzero(visible)
+  size_class = size_class.reshape(-1)
+  for c, (w, h) in enumerate(sizes.tolist()):
+    k = members[size_class == c]
+    dy, dx = np.mgrid[0:h, 0:w]
+    # ((2dx+1-w)/w)² + ((2dy+1-h)/h)² <= 1 in integers
+    mask = (2*dx + 1 - w)**2 * h*h + (2*dy + 1 - h)**2 * w*w <= w*w * h*h
+    ox, oy = dx[mask], dy[mask]
+
+    whole = k[~clipped[k]]
+    if len(whole):
+      flat = (by0[whole] * width + bx0[whole]).astype(np.int32)[:, None] + (oy * width + ox).astype(np.int32)
+      np.maximum.at(owner, flat.ravel(), np.repeat(whole.astype(np.int32), len(ox)))
+
+    cut = k[clipped[k]]
+    if len(cut):
+      px = bx0[cut, None] + ox
+      py = by0[cut, None] + oy
+      inside = (px >= 0) & (px < width) & (py >= 0) & (py < height)
+      idx = np.broadcast_to(cut[:, None], px.shape)
+      np.maximum.at(owner, py[inside] * width + px[inside], idx[inside].astype(np.int32))
+  return owner
+
+class Canvas:
+  # everything needed to rasterize a snapshot, small and picklable so render workers get their own copy
+  def __init__(
+    self, width: int, height: int, scale: DTYPE,
+    statics: list[tuple], background_clr: tuple[int, int, int],
+    border_clr: tuple[int, int, int], watermark_clr: tuple[int, int, int],
+    backend: str='pil',
+  ) -> None:
+    assert backend in ('pil', 'numpy'), f'unknown backend {backend}'
+    self.backend = backend
+    self.width, self.height = width, height
+    self.scale = scale
+    self.statics = statics
+    self.background_clr = background_clr
+    self.border_clr = border_clr
+    self.watermark_clr = watermark_clr
+    # borders and watermark only get rasterized once per watermark
+    self._backgrounds: dict[tuple[str, int, int] | None, Image.Image] = {}
+    self._arrays: dict[tuple[str, int, int] | None, NDArray[np.uint8]] = {}
+
+  def flipy(self, height, y) -> DTYPE:
+    return height - y
+
+  def background(self, watermark: tuple[str, int, int] | None=None) -> Image.Image:
+    img = self._backgrounds.get(watermark)
+    if img is None:
+      img = self._backgrounds[watermark] = self._draw_background(watermark)
+    return img
+
+  def _draw_background(self, watermark: tuple[str, int, int] | None) -> Image.Image:
+    img = Image.new(
+      mode='RGB',
+      size=(
+        int(self.width * self.scale),
+        int(self.height * self.scale)
+      ),
+      color=self.background_clr,
+    )
+    draw = ImageDraw.Draw(img)
+
+    for stat in self.statics:
+      match stat:
+        case ('circle', x, y, radius):
+          draw.ellipse(
+            xy=(  # type: ignore[arg-type]
+              (x - radius) * self.scale,
+              self.flipy(self.height, y + radius) * self.scale,
+              (x + radius) * self.scale,
+              self.flipy(self.height, y - radius) * self.scale,
+            ),
+            fill=self.border_clr,
+          )
+        case ('rectangle', x, y, width, height):
+          draw.rectangle(
+            xy=(  # type: ignore[arg-type]
+              x * self.scale,
+              self.flipy(self.height, y + height) * self.scale,
+              (x + width) * self.scale,
+              self.flipy(self.height, y) * self.scale,
+            ),
+            fill=self.border_clr,
+          )
+    if watermark:
+      assert len(watermark) == 3, f'{watermark=} is not of form ("watermark", x, y)'
+      text, x, y = watermark
+      if platform.system() == 'Windows':
+        font = ImageFont.truetype('ariblk.ttf', self.height // 4)
+      else:
+        font = ImageFont.truetype('Arial Black.ttf', self.height // 4)
+      draw.text(xy=(x,y), text=text, align='left', anchor='mm', fill=self.watermark_clr, font=font)
+    return img
+
+  def draw_array(self, snapshot: FrameSnapshot, watermark: tuple[str, int, int] | None=None) -> NDArray[np.uint8]:
+    if self.backend == 'pil': return np.asarray(self.draw(snapshot, watermark))
+    background = self._arrays.get(watermark)
+    if background is None:
+      background = self._arrays[watermark] = np.asarray(self.background(watermark))
+    img = background.copy()
+    h, w = img.shape[:2]
+    x, y, r = snapshot.location[:, 0], snapshot.location[:, 1], snapshot.radius
+    # y flipped like flipy does, for all circles at once
+    owner = stamp_circles(
+      (x - r) * self.scale, (self.height - (y + r)) * self.scale,
+      (x + r) * self.scale, (self.height - (y - r)) * self.scale,
+      w, h,
+    )
+    covered = np.flatnonzero(owner >= 0)
+    top = owner[covered]
+    # one channel at a time is a lot faster than fancy indexing whole rgb rows
+    flat = img.reshape(-1, 3)
+    for ch in range(3):
+      flat[:, ch][covered] = snapshot.color[:, ch][top]
+    return img
+
+  def draw(self, snapshot: FrameSnapshot, watermark: tuple[str, int, int] | None=None) -> Image.Image:
+    if self.backend == 'numpy': return Image.fromarray(self.draw_array(snapshot, watermark))
+    img = self.background(watermark).copy()
+    draw = ImageDraw.Draw(img)
+    for (x, y), radius, clr in zip(snapshot.location, snapshot.radius, snapshot.color.tolist()):
+      draw.ellipse(
+        xy=(  # type: ignore[arg-type]
+          (x - radius) * self.scale,
+          self.flipy(self.height, y + radius) * self.scale,
+          (x + radius) * self.scale,
+          self.flipy(self.height, y - radius) * self.scale,
+        ),
+        fill=tuple(clr),
+      )
+
+    return img
+
+class _FrameJob:
+  # turns a snapshot into its outputs: an optional jpg at frame_path.format(i) and/or the raw rgb24 bytes
+  def __init__(self, canvas: Canvas, watermark: tuple[str, int, int] | None, frame_path: str | None, raw: bool) -> None:
+    self.canvas = canvas
+    self.watermark = watermark
+    self.frame_path = frame_path
+    self.raw = raw
+
+  def __call__(self, i: int, snapshot: FrameSnapshot) -> bytes | None:
+    img = self.canvas.draw(snapshot, self.watermark)
+    if self.frame_path is not None:
+      img.save(self.frame_path.format(i), quality=95, subsampling=0)
+    return img.tobytes() if self.raw else None
+
+# render worker state, set once per process by _init_worker
+_worker: dict = {}
+
+def _init_worker(job: _FrameJob) -> None:
+  _worker['job'] = job
+
+def _render_frame(i: int, snapshot: FrameSnapshot) -> bytes | None:
+  return _worker['job'](i, snapshot)
+
 class Renderer:
   def __init__(self, space: Space, scale: float, watermark:str='', step_size:int=1) -> None:
     self.space: Space = space
@@ -34,6 +215,19 @@ class Renderer:
     self.border_clr: bytes = b'#B4B4B4'
     self.watermark_clr: bytes = b'#C3C3C3'
     self.background_clr: bytes = b'#000000'
+    # 'pil' draws circles one by one with ImageDraw, 'numpy' stamps all of them into an array at once
+    self.backend: str = 'pil'
+
+    # the canvas (and its cached background) is reused until the statics, scale or colors change
+    self._canvas: Canvas | None = None
+    self._canvas_key: tuple | None = None
+    # color of the k-th circle, the same sequence random.Random(1440).choice(clrs) gives
+    self._colors: NDArray[np.uint8] = np.empty((0, 3), dtype=np.uint8)
+    self._colors_key: tuple[bytes, ...] = ()
+    self._color_rng = random.Random(x=1440)
+    # if set, frames are replayed from the recorded trajectory instead of stepping the space,
+    # the space then only provides the borders and, if none were recorded, the radii
+    self.trajectory: Trajectory | None = None
 
   def _dims(self):
     w = h = 0
@@ -59,66 +253,51 @@ class Renderer:
   def flipy(self, height, y) -> DTYPE:
     return height - y
 
-  def render_current_frame(self, watermark: tuple[str, int, int] | None=None) -> Image.Image:
-    r = random.Random(x=1440)
-    img = Image.new(
-      mode='RGB',
-      size=(
-        int(self.width * self.scale),
-        int(self.height * self.scale)
-      ),
-      color=self.hex_to_tuple(self.background_clr),
-    )
-    draw = ImageDraw.Draw(img)
-
+  def canvas(self) -> Canvas:
+    statics: list[tuple] = []
     for _stat in self.space.statics:
       match type(_stat):
         case shapes.CircleBorder:
           cborder = cast(shapes.CircleBorder, _stat)
-          draw.ellipse(
-            xy=(  # type: ignore[arg-type]
-              (cborder.x - cborder.radius) * self.scale,
-              self.flipy(self.height, cborder.y + cborder.radius) * self.scale,
-              (cborder.x + cborder.radius) * self.scale,
-              self.flipy(self.height, cborder.y - cborder.radius) * self.scale,
-            ),
-            fill=self.hex_to_tuple(self.border_clr),
-          )
+          statics.append(('circle', cborder.x, cborder.y, cborder.radius))
         case shapes.RectangleBorder:
           rborder = cast(shapes.RectangleBorder, _stat)
-          draw.rectangle(
-            xy=(  # type: ignore[arg-type]
-              rborder.x * self.scale,
-              self.flipy(self.height, rborder.y + rborder.height) * self.scale,
-              (rborder.x + rborder.width) * self.scale,
-              self.flipy(self.height, rborder.y) * self.scale,
-            ),
-            fill=self.hex_to_tuple(self.border_clr),
-          )
-    if watermark:
-      assert len(watermark) == 3, f'{watermark=} is not of form ("watermark", x, y)'
-      text, x, y = watermark
-      if platform.system() == 'Windows':
-        font = ImageFont.truetype('ariblk.ttf', self.height // 4)
-      else:
-        font = ImageFont.truetype('Arial Black.ttf', self.height // 4)
-      draw.text(xy=(x,y), text=text, align='left', anchor='mm', fill=self.hex_to_tuple(self.watermark_clr), font=font)
+          statics.append(('rectangle', rborder.x, rborder.y, rborder.width, rborder.height))
+    key = (self.width, self.height, self.scale, tuple(statics), self.background_clr, self.border_clr, self.watermark_clr, self.backend)
+    if self._canvas is None or self._canvas_key != key:
+      self._canvas = Canvas(
+        self.width, self.height, self.scale, statics,
+        self.hex_to_tuple(self.background_clr),
+        self.hex_to_tuple(self.border_clr),
+        self.hex_to_tuple(self.watermark_clr),
+        self.backend,
+      )
+      self._canvas_key = key
+    return self._canvas
 
-    for _kin in self.space.kinetics:
-      match type(_kin):
-        case shapes.Circle:
-          kin = cast(shapes.Circle, _kin)
-          draw.ellipse(
-            xy=(  # type: ignore[arg-type]
-              (kin.x - kin.radius) * self.scale,
-              self.flipy(self.height, kin.y + kin.radius) * self.scale,
-              (kin.x + kin.radius) * self.scale,
-              self.flipy(self.height, kin.y - kin.radius) * self.scale,
-            ),
-            fill=self.hex_to_tuple(r.choice(self.clrs)),
-          )
+  def colors(self, n: int) -> NDArray[np.uint8]:
+    if self._colors_key != tuple(self.clrs):
+      self._colors = np.empty((0, 3), dtype=np.uint8)
+      self._colors_key = tuple(self.clrs)
+      self._color_rng = random.Random(x=1440)
+    if len(self._colors) < n:
+      palette = [self.hex_to_tuple(clr) for clr in self.clrs]
+      more = [palette[self._color_rng.randrange(len(palette))] for _ in range(n - len(self._colors))]
+      self._colors = np.concatenate((self._colors, np.array(more, dtype=np.uint8).reshape(-1, 3)))
+    return self._colors[:n]
 
-    return img
+  def snapshot(self) -> FrameSnapshot:
+    b = self.space.bodies
+    circles = b.kind == type_id(shapes.Circle)
+    n = int(circles.sum())
+    return FrameSnapshot(
+      b.location[circles],
+      b.radius[circles],
+      self.colors(n),
+    )
+
+  def render_current_frame(self, watermark: tuple[str, int, int] | None=None) -> Image.Image:
+    return self.canvas().draw(self.snapshot(), watermark)
 
   def bad_live_render(self) -> None:
     plt.ion()
@@ -134,7 +313,63 @@ class Renderer:
       ax.axis('off')
       ax.cla()
   
-  def render(self, frame_count: int, frame_rate: float=30.0, path: str='output') -> None:
+  def replay(self, frame_count: int) -> Iterator[FrameSnapshot]:
+    # one video frame per recorded frame, stops early if the trajectory is shorter
+    traj = self.trajectory
+    assert traj is not None, 'no trajectory to replay'
+    b = self.space.bodies
+    if traj.radius is None:
+      assert b.n == traj.n, f'trajectory without radii records {traj.n} bodies, the space holds {b.n}'
+    circles = b.kind == type_id(shapes.Circle) if b.n == traj.n else np.ones(traj.n, dtype=np.bool_)
+    n = int(circles.sum())
+    for i in range(min(frame_count, len(traj))):
+      yield FrameSnapshot(
+        traj.location[i][circles],
+        traj.radius[i][circles] if traj.radius is not None else b.radius[circles],
+        self.colors(n),
+      )
+
+  def snapshots(self, frame_count: int) -> Iterator[FrameSnapshot]:
+    if self.trajectory is not None:
+      yield from self.replay(frame_count)
+      return
+    # the space is advanced step_size steps after every captured frame
+    for _ in range(frame_count):
+      yield self.snapshot()
+      self.space.run(self.step_size)
+
+  def frames(
+    self, frame_count: int, watermark: tuple[str, int, int] | None=None, workers: int=0,
+    frame_path: str | None=None, raw: bool=False,
+  ) -> Iterator[bytes | None]:
+    # yields every frame in order, as raw rgb24 bytes if raw, jpgs are written to frame_path.format(i) if given
+    # with workers > 0 a process pool rasterizes while the simulation keeps producing snapshots,
+    # at most 2 * workers frames are in flight
+    job = _FrameJob(self.canvas(), watermark, frame_path, raw)
+    if workers <= 0:
+      for i, snapshot in enumerate(self.snapshots(frame_count)):
+        yield job(i, snapshot)
+      return
+
+    pending: deque[Future] = deque()
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(job,)) as pool:
+      for i, snapshot in enumerate(self.snapshots(frame_count)):
+        if len(pending) >= 2 * workers:
+          yield pending.popleft().result()
+        pending.append(pool.submit(_render_frame, i, snapshot))
+      while pending:
+        yield pending.popleft().result()
+
+  def render_frames(self, frame_count: int, frame_path: str, watermark: tuple[str, int, int] | None=None, workers: int=0) -> None:
+    for _ in tqdm(self.frames(frame_count, watermark, workers, frame_path), total=frame_count, desc='Rendering video...'):
+      pass
+
+  def render(
+    self, frame_count: int, frame_rate: float=30.0, path: str='output', workers: int=0,
+    stream: bool=False, codec: str='libx264', crf: int=18, keep_frames: bool=False,
+  ) -> None:
+    # stream pipes raw frames straight into ffmpeg's stdin instead of writing jpgs and encoding them afterwards,
+    # keep_frames additionally writes the jpgs
     otp = Path(path)
     if not otp.exists():
       otp.mkdir()
@@ -151,28 +386,47 @@ class Renderer:
       return
 
     frames_path = Path(proj_path / 'frames')
-    if not frames_path.exists():
-      frames_path.mkdir()
-    elif not proj_path.is_dir():
-      print(f'{frames_path.absolute()} is no valid directory')
-      return
+    if not stream or keep_frames:
+      if not frames_path.exists():
+        frames_path.mkdir()
+      elif not frames_path.is_dir():
+        print(f'{frames_path.absolute()} is no valid directory')
+        return
     
     frame_name = 'frame' 
     extension = 'jpg'
+    frame_path = f'{str(proj_path)}/frames/{frame_name}-{{:08d}}.{extension}'
+    watermark = (self.watermark, int(self.width * self.scale / 2), int(self.height * self.scale / 2))
+    video_name = 'video'
 
-    for i in (t:=trange(frame_count)):
-      self.render_current_frame(
-        (self.watermark, int(self.width * self.scale / 2), int(self.height * self.scale / 2)),
-      ).save(
-        f'{str(proj_path)}/frames/{frame_name}-{i:08d}.{extension}',
-        quality=95,
-        subsampling=0,
+    if stream:
+      print(f'Streaming {proj_path / video_name} ...')
+      process = (
+        ffmpeg
+        .input('pipe:', format='rawvideo', pix_fmt='rgb24', s=f'{int(self.width * self.scale)}x{int(self.height * self.scale)}', framerate=frame_rate)
+        # yuv420p needs even dimensions
+        .output(f'{proj_path / video_name}.mp4', vcodec=codec, crf=crf, pix_fmt='yuv420p', vf='pad=ceil(iw/2)*2:ceil(ih/2)*2', loglevel='error')
+        .overwrite_output()
+        .run_async(pipe_stdin=True, pipe_stderr=True)
       )
-      t.set_description('Rendering video...')
+      try:
+        frames = self.frames(frame_count, watermark, workers, frame_path if keep_frames else None, raw=True)
+        for data in tqdm(frames, total=frame_count, desc='Rendering video...'):
+          process.stdin.write(data)
+      except BrokenPipeError:
+        # ffmpeg quit early, e.g. on a bad codec or crf, its exit status below says why
+        pass
+      finally:
+        # closes stdin and waits for the encoder to finish
+        _, err = process.communicate()
+      if process.returncode != 0:
+        raise ffmpeg.Error('ffmpeg', None, err)
+      return
+
+    self.render_frames(frame_count, frame_path, watermark, workers)
 
     print(f'Saved all frames in {str(otp / proj_path)}')
 
-    video_name = 'video'
     print(f'Saving {proj_path / video_name} ...')
     video = ffmpeg.input(f'{str(proj_path)}/frames/{frame_name}-%08d.{extension}', framerate=frame_rate)
     ffmpeg.output(video, f'{proj_path / video_name}.mp4', loglevel='quiet', crf=18).run()
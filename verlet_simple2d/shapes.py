@@ -1,98 +1,126 @@
 from __future__ import annotations
 
+import os
+
 import numpy as np
 from numpy.typing import NDArray
 
 from verlet_simple2d import DTYPE
 from verlet_simple2d.helpers import fmt_asrt
+from verlet_simple2d.store import LOOSE, BodyStore, type_id, type_of
 
+# constructors always validate their arguments, setters only in debug mode (VERLET_SIMPLE2D_DEBUG=1 or shapes.DEBUG = True)
+DEBUG: bool = os.environ.get('VERLET_SIMPLE2D_DEBUG', '') not in ('', '0')
+_SCALAR = (int, float, np.number)
+_VECTOR = (tuple, list, np.ndarray)
 
 class Body:
-  def __init__(self, x: float, y:float) -> None:
-    self._location: NDArray[DTYPE] = np.array((x, y), dtype=DTYPE)
-    self._prev_location: NDArray[DTYPE] = np.array((x, y), dtype=DTYPE)
-    self._acceleration: NDArray[DTYPE] = np.array((0.0, 0.0), dtype=DTYPE)
+  # a body is a handle into a BodyStore row, standalone bodies hold a row of the shared LOOSE store
+  # once added to a Space the row is moved into the space's store
+  # handles only hold (store, index), subclasses without state of their own should declare empty __slots__
+  __slots__ = ('_store', '_index')
 
-    self._collision_type: type[Body] | int
+  def __init__(self, x: float, y:float) -> None:
+    assert isinstance(x, _SCALAR) and isinstance(y, _SCALAR), fmt_asrt('x and y', _SCALAR)
+    self._store: BodyStore = LOOSE
+    self._index: int = LOOSE.take(type_id(type(self)), x, y)
 
-    self._collisions: int = 0
-    self.mass: DTYPE = DTYPE(1)
-    # self._mass: DTYPE = DTYPE(1)
+  def __del__(self) -> None:
+    # standalone bodies hand their row back, bodies that failed validation never got one
+    if getattr(self, '_store', None) is LOOSE: LOOSE.give(self._index)
     # self._elasticity: DTYPE = DTYPE(1)
   
   @property
   def x(self) -> DTYPE:
-    return self._location[0]
+    return self._store._location[self._index, 0]
 
   @x.setter
   def x(self, val) -> None:
-    assert isinstance(val, (int, float, DTYPE)), fmt_asrt('x', (int, float, DTYPE)) # type: ignore[misc]
-    self._location[0] = DTYPE(val)
+    if DEBUG: assert isinstance(val, _SCALAR), fmt_asrt('x', _SCALAR)
+    self._store._location[self._index, 0] = val
 
   @property
   def y(self) -> DTYPE:
-    return self._location[1]
+    return self._store._location[self._index, 1]
 
   @y.setter
   def y(self, val) -> None:
-    assert isinstance(val, (int, float, DTYPE)), fmt_asrt('y', (int, float, DTYPE)) # type: ignore[misc]
-    self._location[1] = DTYPE(val)
+    if DEBUG: assert isinstance(val, _SCALAR), fmt_asrt('y', _SCALAR)
+    self._store._location[self._index, 1] = val
 
   @property
   def location(self) -> NDArray[DTYPE]:
-    return self._location
+    return self._store._location[self._index]
   
   @location.setter
   def location(self, val) -> None:
-    assert isinstance(val, (tuple, list, np.ndarray)), fmt_asrt('location', (tuple, list, np.ndarray)) 
-    if isinstance(val, np.ndarray):
-      self._location = val
-    else:
-      self._location = np.array(val, dtype=DTYPE)
+    if DEBUG: assert isinstance(val, _VECTOR), fmt_asrt('location', _VECTOR)
+    self._store._location[self._index] = val
     #vel = self.velocity
     #self.prev_location = self.location + (-vel)
 
+  # acceleration and force are per body and get applied on top of Space.gravity every step
   @property
   def acceleration(self) -> NDArray[DTYPE]:
-    return self._acceleration
+    return self._store._acceleration[self._index]
 
   @acceleration.setter
   def acceleration(self, val) -> None:
-    assert isinstance(val, (tuple, list, np.ndarray)), fmt_asrt('acceleration', (tuple, list, np.ndarray))
-    if isinstance(val, np.ndarray):
-      self._acceleration = val
-    else:
-      self._acceleration = np.array(val, dtype=DTYPE)
+    if DEBUG: assert isinstance(val, _VECTOR), fmt_asrt('acceleration', _VECTOR)
+    self._store._acceleration[self._index] = val
+
+  @property
+  def force(self) -> NDArray[DTYPE]:
+    return self._store._force[self._index]
+
+  @force.setter
+  def force(self, val) -> None:
+    if DEBUG: assert isinstance(val, _VECTOR), fmt_asrt('force', _VECTOR)
+    self._store._force[self._index] = val
 
   @property
   def prev_x(self) -> DTYPE:
-    return self._prev_location[0]
+    return self._store._prev_location[self._index, 0]
 
   @prev_x.setter
   def prev_x(self, val) -> None:
-    assert isinstance(val, (int, float, DTYPE)), fmt_asrt('prev_x', (int, float, DTYPE)) # type: ignore[misc]
-    self._prev_location[0] = DTYPE(val)
+    if DEBUG: assert isinstance(val, _SCALAR), fmt_asrt('prev_x', _SCALAR)
+    self._store._prev_location[self._index, 0] = val
 
   @property
   def prev_y(self) -> DTYPE:
-    return self._prev_location[1]
+    return self._store._prev_location[self._index, 1]
 
   @prev_y.setter
   def prev_y(self, val) -> None:
-    assert isinstance(val, (int, float, DTYPE)), fmt_asrt('prev_y', (int, float, DTYPE)) # type: ignore[misc]
-    self._prev_location[1] = DTYPE(val)
+    if DEBUG: assert isinstance(val, _SCALAR), fmt_asrt('prev_y', _SCALAR)
+    self._store._prev_location[self._index, 1] = val
 
   @property
   def prev_location(self) -> NDArray[DTYPE]:
-    return self._prev_location
+    return self._store._prev_location[self._index]
   
   @prev_location.setter
   def prev_location(self, val) -> None:
-    assert isinstance(val, (tuple, list, np.ndarray)), fmt_asrt('prev_location', (tuple, list, np.ndarray)) 
-    if isinstance(val, np.ndarray):
-      self._prev_location = val
-    else:
-      self._prev_location = np.array(val, dtype=DTYPE)
+    if DEBUG: assert isinstance(val, _VECTOR), fmt_asrt('prev_location', _VECTOR)
+    self._store._prev_location[self._index] = val
+
+  @property
+  def mass(self) -> DTYPE:
+    return self._store._mass[self._index]
+
+  @mass.setter
+  def mass(self, val) -> None:
+    if DEBUG: assert isinstance(val, _SCALAR), fmt_asrt('mass', _SCALAR)
+    self._store._mass[self._index] = val
+
+  @property
+  def _collisions(self) -> int:
+    return int(self._store._collisions[self._index])
+
+  @_collisions.setter
+  def _collisions(self, val: int) -> None:
+    self._store._collisions[self._index] = val
   
   @property
   def collision_type(self) -> type[Body] | int:
@@ -100,8 +128,17 @@ class Body:
 
   @collision_type.setter
   def collision_type(self, val) -> None:
-    assert isinstance(val, int), fmt_asrt('collision_type', int)
+    if DEBUG: assert isinstance(val, int), fmt_asrt('collision_type', int)
     self._collision_type = val
+
+  @property
+  def _collision_type(self) -> type[Body] | int:
+    return type_of(int(self._store._collision_type[self._index]))
+
+  @_collision_type.setter
+  def _collision_type(self, val: type[Body] | int) -> None:
+    self._store._collision_type[self._index] = type_id(val)
+    self._store.version += 1
   
   """
   @property
@@ -110,7 +147,7 @@ class Body:
 
   @velocity.setter
   def velocity(self, val) -> None:
-    assert isinstance(val, (tuple, list, np.ndarray)), fmt_asrt('velocity', (tuple, list, np.ndarray))
+    assert isinstance(val, _VECTOR), fmt_asrt('velocity', _VECTOR)
     if isinstance(val, np.ndarray): self.prev_location = self.location + (-val)
     else: self.prev_location = self.location + (-np.array(val, dtype=DTYPE))
   """
@@ -119,22 +156,28 @@ class Body:
     return f'{self.__class__.__name__} (x={self.x:.2f}, y={self.y:.2f}, \'x={self.prev_x:.2f}, \'y={self.prev_y:.2f}, velocity=({self.location[0]-self.prev_location[0]:.2f}{self.location[1]-self.prev_location[1]:.2f}), collisiontype={(self.collision_type) if isinstance(self.collision_type, int) else self.collision_type.__name__})'
 
 class Circle(Body):
+  __slots__ = ()
+
   def __init__(self, x: float, y: float, r: float) -> None:
+    assert isinstance(r, _SCALAR), fmt_asrt('r', _SCALAR)
     super().__init__(x, y)
-    self._radius: DTYPE = DTYPE(r)
+    self._store._radius[self._index] = r
     self._collision_type = Circle
   
   @property
   def radius(self) -> DTYPE:
-    return self._radius
+    return self._store._radius[self._index]
 
   @radius.setter
   def radius(self, val) -> None:
-    assert isinstance(val, (int, float, DTYPE)), fmt_asrt('radius', (int, float, DTYPE)) # type: ignore[misc]
-    self._radius = DTYPE(val)
+    if DEBUG: assert isinstance(val, _SCALAR), fmt_asrt('radius', _SCALAR)
+    self._store._radius[self._index] = val
 
 class Rectangle(Body):
+  __slots__ = ('_dims', '_ang_vel')
+
   def __init__(self, x: float, y: float, width: float, height: float) -> None:
+    assert isinstance(width, _SCALAR) and isinstance(height, _SCALAR), fmt_asrt('width and height', _SCALAR)
     super().__init__(x, y)
     self._dims: NDArray[DTYPE] = np.array((width, height), dtype=DTYPE)
     self._ang_vel: NDArray = np.array((0,0), dtype=DTYPE)
@@ -145,7 +188,7 @@ class Rectangle(Body):
   
   @width.setter
   def width(self, val) -> None:
-    assert isinstance(val, (float, int, DTYPE)), fmt_asrt('width', (float, int, DTYPE)) # type: ignore[misc]
+    if DEBUG: assert isinstance(val, _SCALAR), fmt_asrt('width', _SCALAR)
     self._dims[0] = val
 
   @property
@@ -154,7 +197,7 @@ class Rectangle(Body):
 
   @height.setter
   def height(self, val) -> None:
-    assert isinstance(val, (float, int, DTYPE)), fmt_asrt('height', (float, int, DTYPE)) # type: ignore[misc]
+    if DEBUG: assert isinstance(val, _SCALAR), fmt_asrt('height', _SCALAR)
     self._dims[1] = val
 
   @property
@@ -163,12 +206,16 @@ class Rectangle(Body):
   
   @dims.setter
   def dims(self, val) -> None:
-    assert isinstance(val, (tuple, list, np.ndarray)), fmt_asrt('dims', (tuple, list, np.ndarray))
+    if DEBUG: assert isinstance(val, _VECTOR), fmt_asrt('dims', _VECTOR)
     if isinstance(val, np.ndarray): self._dims = val
     else: self._dims = np.array(val, dtype=DTYPE)
 
 class Border:
+  __slots__ = ('_location', 'line_width', '_collision_type', '_collisions')
+
   def __init__(self, x: float, y: float, line_width: float=1) -> None:
+    assert isinstance(x, _SCALAR) and isinstance(y, _SCALAR), fmt_asrt('x and y', _SCALAR)
+    assert isinstance(line_width, _SCALAR), fmt_asrt('line_width', _SCALAR)
     self._location: NDArray[DTYPE] = np.array((x, y), dtype=DTYPE)
     self.line_width: DTYPE = DTYPE(line_width)
     self._collision_type: type[Border] | int
@@ -180,7 +227,7 @@ class Border:
 
   @x.setter
   def x(self, val) -> None:
-    assert isinstance(val, (int, float, DTYPE)), fmt_asrt('x', (int, float, DTYPE)) # type: ignore[misc]
+    if DEBUG: assert isinstance(val, _SCALAR), fmt_asrt('x', _SCALAR)
     self._location[0] = DTYPE(val)
 
   @property
@@ -189,7 +236,7 @@ class Border:
 
   @y.setter
   def y(self, val) -> None:
-    assert isinstance(val, (int, float, DTYPE)), fmt_asrt('y', (float, int, DTYPE)) # type: ignore[misc]
+    if DEBUG: assert isinstance(val, _SCALAR), fmt_asrt('y', _SCALAR)
     self._location[1] = DTYPE(val)
   
   @property
@@ -198,9 +245,9 @@ class Border:
   
   @location.setter
   def location(self, val) -> None:
-    assert isinstance(val, (list, tuple, np.ndarray)), fmt_asrt('location', (list, tuple, np.ndarray))
+    if DEBUG: assert isinstance(val, _VECTOR), fmt_asrt('location', _VECTOR)
     if isinstance(val, np.ndarray): self._location = val
-    else: self._location = np.ndarray(val, dtype=DTYPE)
+    else: self._location = np.array(val, dtype=DTYPE)
 
   @property
   def collision_type(self) -> type[Border] | int:
@@ -208,11 +255,14 @@ class Border:
   
   @collision_type.setter
   def collision_type(self, val) -> None:
-    assert isinstance(val, int), fmt_asrt('collision_type', int)
+    if DEBUG: assert isinstance(val, int), fmt_asrt('collision_type', int)
     self._collision_type = val
 
 class CircleBorder(Border):
+  __slots__ = ('_radius',)
+
   def __init__(self, x: float, y: float, r: float, line_width: float=1) -> None:
+    assert isinstance(r, _SCALAR), fmt_asrt('r', _SCALAR)
     super().__init__(x, y, line_width)
     self._radius: DTYPE = DTYPE(r)
     self._collision_type = CircleBorder
@@ -223,11 +273,14 @@ class CircleBorder(Border):
   
   @radius.setter
   def radius(self, val) -> None:
-    assert isinstance(val, (int, float, DTYPE)), fmt_asrt('radius', (float, int, DTYPE)) # type: ignore[misc]
+    if DEBUG: assert isinstance(val, _SCALAR), fmt_asrt('radius', _SCALAR)
     self._radius = DTYPE(val)
 
 class RectangleBorder(Border):
+  __slots__ = ('_dims',)
+
   def __init__(self, x: float, y: float, width: float, height: float, line_width: float) -> None:
+    assert isinstance(width, _SCALAR) and isinstance(height, _SCALAR), fmt_asrt('width and height', _SCALAR)
     super().__init__(x, y, line_width)
     self._dims: NDArray[DTYPE] = np.array((width, height), dtype=DTYPE)
     self._collision_type = RectangleBorder
@@ -238,7 +291,7 @@ class RectangleBorder(Border):
   
   @width.setter
   def width(self, val) -> None:
-    assert isinstance(val, (float, int , DTYPE)), fmt_asrt('width', (float, int, DTYPE)) # type: ignore[misc]
+    if DEBUG: assert isinstance(val, _SCALAR), fmt_asrt('width', _SCALAR)
     self._dims[0] = DTYPE(val)
 
   @property
@@ -247,7 +300,7 @@ class RectangleBorder(Border):
   
   @height.setter
   def height(self, val) -> None:
-    assert isinstance(val, (float, int , DTYPE)), fmt_asrt('height', (float, int, DTYPE)) # type: ignore[misc]
+    if DEBUG: assert isinstance(val, _SCALAR), fmt_asrt('height', _SCALAR)
     self._dims[1] = DTYPE(val)
 
   @property 
@@ -256,8 +309,8 @@ class RectangleBorder(Border):
   
   @dims.setter
   def dims(self, val) -> None:
-    assert isinstance(val, (tuple, list, np.ndarray)), fmt_asrt('dims', (tuple, list, np.ndarray))
+    if DEBUG: assert isinstance(val, _VECTOR), fmt_asrt('dims', _VECTOR)
     if isinstance(val, np.ndarray):
       self._dims = val
     else:
-      self._dims = np.ndarray(val, dtype=DTYPE)
+      self._dims = np.array(val, dtype=DTYPE)
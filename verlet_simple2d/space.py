@@ -1,32 +1,113 @@
 from __future__ import annotations
 
+import json
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Callable
+
 import numpy as np
 from numpy.typing import NDArray
+from scipy.sparse import coo_matrix  # type: ignore[import-untyped]
+from scipy.sparse.csgraph import connected_components  # type: ignore[import-untyped]
 
-from verlet_simple2d import DTYPE, shapes
-from verlet_simple2d.handler import CollisionHandler, get_handler
+from verlet_simple2d import DTYPE, helpers, shapes
+from verlet_simple2d.broadphase import Broadphase, BruteForce, from_config
+from verlet_simple2d.emitter import Emitter, Sink
+from verlet_simple2d.handler import CircleCircleHandler, CollisionHandler, SweptCircleCircleHandler, get_handler, get_handler_for_types
 from verlet_simple2d.helpers import fmt_asrt
+from verlet_simple2d.stats import StepStats, TimedHandler
+from verlet_simple2d.store import BodyStore, type_count, type_id, type_of
+from verlet_simple2d.trajectory import TrajectoryWriter
 
 
 class Space:
-  def __init__(self, dt: float) -> None:
-    self.kinetics: list[shapes.Body] = []
+  def __init__(self, dt: float, dtype=DTYPE) -> None:
+    # float type of the whole simulation state, bodies are converted when they are added
+    self.dtype = np.dtype(dtype)
+    self._bodies: BodyStore = BodyStore(dtype=self.dtype)
     self.statics: list[shapes.Border] = []
-    self._gravity: NDArray[DTYPE] = np.array((0, -10), dtype=DTYPE)
-    self.dt: DTYPE = DTYPE(dt)
+    self._gravity: NDArray[DTYPE] = np.array((0, -10), dtype=self.dtype)
+    self.dt: DTYPE = self.dtype.type(dt)
 
     self.collision_handlers: list[CollisionHandler] = []
+    # (kind, collision_type) id pairs of both sides -> handler, filled lazily and reset when handlers change
+    self._dispatch: dict[tuple[int, int, int, int], CollisionHandler | None] = {}
+    self._dispatch_size: int = 0
+    self._handler_index: dict[tuple, int] = {}
+    # bumped whenever borders are added or removed, or bodies one by one (add_circles and remove_bodies don't)
+    self._version: int = 0
+    self._layout_key: tuple[int, ...] | None = None
+    self._layout_cache: Space._Layout | None = None
+    # distinct (shape class, collision_type) of everything added so far
+    self._body_kinds: dict[tuple[type, Any], None] = {}
+    self._static_kinds: dict[tuple[type, Any], None] = {}
+    self.broadphase: Broadphase = BruteForce()
+    # resolve body pairs with the vectorized handler paths instead of one pair at a time
+    self.batched: bool = False
+    # continuous circle-circle collisions, see ccd
+    self._ccd: bool = False
+    # per phase timings and counters, only collected while set
+    self.stats: StepStats | None = None
+    # if set, islands of touching bodies that all moved less than sleep_threshold per step for
+    # sleep_steps steps fall asleep: they are neither integrated nor tested against each other or borders
+    # until an awake body pushes one of them, their force or acceleration changes or gravity, bodies or borders change
+    self.sleep_threshold: float | None = None
+    self.sleep_steps: int = 60
+    self._asleep: NDArray[np.bool_] | None = None
+    # force and acceleration of every body when the sleep state was last set, sleepers wake when either changes
+    self._rest_force: NDArray[DTYPE] = np.empty((0, 2), dtype=DTYPE)
+    self._rest_acceleration: NDArray[DTYPE] = np.empty((0, 2), dtype=DTYPE)
+    self._sleep_key: tuple | None = None
+    # set when bodies got woken outside of _update_sleep, so their islands get woken with them
+    self._woken: bool = False
+
+    # scratch buffers for integrate, reallocated only when the store grows
+    self._vel: NDArray[DTYPE] = np.empty((0, 2), dtype=DTYPE)
+    self._acc: NDArray[DTYPE] = np.empty((0, 2), dtype=DTYPE)
+
+    # steps taken so far, and the open trajectory recorders with the step they started at
+    self.steps: int = 0
+    # run after every step: emitters spawn new circles, sinks delete the bodies that entered them
+    self.emitters: list[Emitter] = []
+    self.sinks: list[Sink] = []
+    self._recorders: list[tuple[TrajectoryWriter, int]] = []
 
   class _Reverse:
     def __init__(self, space: Space) -> None: self.space = space
     def __enter__(self) -> None: self.rev()
     def __exit__(self, exc_type, exc_value, traceback) -> None: self.rev()
     def rev(self) -> None:
-      for kin in self.space.kinetics:
-        kin.prev_location = kin.location + (kin.location - kin.prev_location)
+      loc, prev = self.space._bodies.location, self.space._bodies.prev_location
+      prev[:] = loc + (loc - prev)
 
   def reverse(self) -> _Reverse:
     return Space._Reverse(self)
+
+  @property
+  def kinetics(self) -> list[shapes.Body]:
+    return list(self._bodies.materialize())
+
+  @property
+  def bodies(self) -> BodyStore:
+    return self._bodies
+
+  @property
+  def sleeping(self) -> int:
+    return int(self._asleep.sum()) if self._asleep is not None else 0
+
+  @property
+  def awake(self) -> int:
+    return self._bodies.n - self.sleeping
+
+  def wake(self, body: shapes.Body | None=None) -> None:
+    # wakes body, or everything, e.g. after moving bodies or borders by hand
+    if body is None:
+      self._bodies.idle[:] = 0
+      self._asleep = None
+    elif body._store is self._bodies:
+      self._bodies.idle[body._index] = 0
+      if self._asleep is not None: self._asleep[body._index] = False
+      self._woken = True
   
   @property
   def gravity(self) -> NDArray[DTYPE]:
@@ -35,69 +116,566 @@ class Space:
   @gravity.setter
   def gravity(self, val) -> None:
     assert isinstance(val, (tuple, list, np.ndarray)), fmt_asrt('gravity', (tuple, list, np.ndarray))
-    if isinstance(val, np.ndarray): self._gravity = val
-    else: self._gravity = np.array(val, dtype=DTYPE)
+    if isinstance(val, np.ndarray): self._gravity = np.asarray(val, dtype=self.dtype)
+    else: self._gravity = np.array(val, dtype=self.dtype)
+
+  @property
+  def ccd(self) -> bool:
+    return self._ccd
+
+  @ccd.setter
+  def ccd(self, val: bool) -> None:
+    # swaps every circle-circle handler for its swept counterpart (or back) and sweeps the broadphase bounds,
+    # so pairs that cross paths within a step are found and resolved at their time of impact
+    self._ccd = bool(val)
+    self.collision_handlers = [self._ccd_handler(h) for h in self.collision_handlers]
+    self._reset_dispatch()
+    self._version += 1
+
+  def _ccd_handler(self, handler: CollisionHandler) -> CollisionHandler:
+    if self._ccd and type(handler) is CircleCircleHandler: return SweptCircleCircleHandler(handler.types)
+    if not self._ccd and type(handler) is SweptCircleCircleHandler: return CircleCircleHandler(handler.types)
+    return handler
 
   def add_collision_handler(self, X: shapes.Body | shapes.Border, Y: shapes.Body | shapes.Border) -> CollisionHandler:
-    handler = get_handler(X, Y)
+    handler = self._ccd_handler(get_handler(X, Y))
     self.collision_handlers.append(handler)
     return handler
+
+  def _reset_dispatch(self) -> None:
+    self._dispatch.clear()
+    self._handler_index.clear()
+    for i, handler in enumerate(self.collision_handlers):
+      self._handler_index.setdefault(tuple(handler.types), i)
+      self._handler_index.setdefault(tuple(handler.types[::-1]), i)
+    self._dispatch_size = len(self.collision_handlers)
+
+  def handler_for(self, kind_x: int, type_x: int, kind_y: int, type_y: int) -> CollisionHandler | None:
+    # constant time lookup by the kind and collision_type ids, resolved once per type pair
+    if self._dispatch_size != len(self.collision_handlers): self._reset_dispatch()
+    key = (kind_x, type_x, kind_y, type_y)
+    if key in self._dispatch: return self._dispatch[key]
+    if self.stats is not None: self.stats.count('handler_lookups')
+
+    cls_x, ct_x, cls_y, ct_y = type_of(kind_x), type_of(type_x), type_of(kind_y), type_of(type_y)
+    found = [
+      self._handler_index.get(k)
+      for k in ((ct_x, ct_y), (cls_y, ct_x), (cls_x, ct_y))
+    ]
+    indices = [i for i in found if i is not None]
+    handler = self.collision_handlers[min(indices)] if indices else None
+    self._dispatch[key] = handler
+    return handler
   
   def get_collision_handler(self, X: shapes.Body | shapes.Border, Y: shapes.Body | shapes.Border) -> CollisionHandler | None:
-    for handler in self.collision_handlers:
-      if handler.check_types(X.collision_type, Y.collision_type):
-        return handler
-      if handler.check_types(type(Y), X.collision_type):
-        return handler
-      if handler.check_types(type(X), Y.collision_type):
-        return handler
-    return None
+    return self.handler_for(
+      type_id(type(X)), type_id(X.collision_type),
+      type_id(type(Y)), type_id(Y.collision_type),
+    )
 
-  def add_body(self, body: shapes.Body | shapes.Border) -> None:
-    if body in self.kinetics or body in self.statics: return
+  def _ensure_handler(self, kind_x: tuple[type, Any], kind_y: tuple[type, Any]) -> None:
+    (cls_x, ct_x), (cls_y, ct_y) = kind_x, kind_y
+    if self.handler_for(type_id(cls_x), type_id(ct_x), type_id(cls_y), type_id(ct_y)) is None:
+      self.collision_handlers.append(self._ccd_handler(get_handler_for_types(cls_x, ct_x, cls_y, ct_y)))
 
-    if isinstance(body, shapes.Body):
-      for stat in self.statics:
-        handler = self.get_collision_handler(body, stat)
-        if handler is None:
-          self.add_collision_handler(body, stat)
-    
-    for kin in self.kinetics:
-      handler = self.get_collision_handler(body, kin)
-      if handler is None:
-        self.add_collision_handler(body, kin)
+  def add_body(self, body: shapes.Body | shapes.Border) -> None:
+    if isinstance(body, shapes.Body) and body._store is self._bodies: return
+    if body in self.statics: return
 
+    kind = (type(body), body.collision_type)
     if isinstance(body, shapes.Body):
-      self.kinetics.append(body)
+      self._bodies.adopt(body)
+      self._add_body_kind(kind)
+      self.broadphase.invalidate()
+      self._version += 1
     elif isinstance(body, shapes.Border):
+      if kind not in self._static_kinds:
+        for kin_kind in self._body_kinds:
+          self._ensure_handler(kind, kin_kind)
+        self._static_kinds[kind] = None
       self.statics.append(body)
+      self._version += 1
 
-  def remove_body(self, body: shapes.Body | shapes.Border) -> None:
-    if body not in self.kinetics and body not in self.statics: return
+  def _add_body_kind(self, kind: tuple[type, Any]) -> None:
+    if kind not in self._body_kinds:
+      for stat_kind in self._static_kinds:
+        self._ensure_handler(kind, stat_kind)
+      self._body_kinds[kind] = None
+      for kin_kind in self._body_kinds:
+        self._ensure_handler(kind, kin_kind)
+
+  def add_circles(
+    self, x, y, r, prev_x=None, prev_y=None, velocity=None, mass=None, collision_type=None, handles: bool=False,
+  ) -> list[shapes.Circle] | None:
+    # adds len(x) circles in one go, every argument but x is either one value per circle or one for all
+    # velocity is per step (location - prev_location) and takes precedence over prev_x, prev_y
+    # collision_type is an int, the default is the Circle class like for single circles
+    # handles are only created if asked for, or when something needs them later on
+    x = np.asarray(x, dtype=self.dtype)
+    n = len(x)
+    location = np.empty((n, 2), dtype=self.dtype)
+    location[:, 0] = x
+    location[:, 1] = y
+    if velocity is not None:
+      prev = location - np.broadcast_to(np.asarray(velocity, dtype=self.dtype), (n, 2))
+    elif prev_x is not None or prev_y is not None:
+      prev = location.copy()
+      if prev_x is not None: prev[:, 0] = prev_x
+      if prev_y is not None: prev[:, 1] = prev_y
+    else:
+      prev = location
 
+    if collision_type is None:
+      types = np.full(n, type_id(shapes.Circle), dtype=np.intp)
+      self._add_body_kind((shapes.Circle, shapes.Circle))
+    else:
+      values, inverse = np.unique(np.broadcast_to(np.asarray(collision_type), (n,)), return_inverse=True)
+      for value in values.tolist():
+        assert isinstance(value, int), fmt_asrt('collision_type', int)
+        self._add_body_kind((shapes.Circle, value))
+      types = np.array([type_id(v) for v in values.tolist()], dtype=np.intp)[inverse.reshape(-1)]
+
+    # bulk rows keep the broadphase caches, the layout and the sleep state, new bodies start awake
+    b = self._bodies
+    sleep_valid = self._sleep_key == self._sleep_state_key()
+    start = b.extend(location, prev, r, 1 if mass is None else mass, type_id(shapes.Circle), types)
+    self.broadphase.appended(b.location, b.radius, start)
+    if sleep_valid:
+      if self._asleep is not None:
+        self._asleep = np.concatenate((self._asleep, np.zeros(n, dtype=np.bool_)))
+        self._rest_force = np.concatenate((self._rest_force, b.force[start:]))
+        self._rest_acceleration = np.concatenate((self._rest_acceleration, b.acceleration[start:]))
+      self._sleep_key = self._sleep_state_key()
+    if handles:
+      return [self._bodies.handle(i) for i in range(start, start + n)]  # type: ignore[misc]
+    return None
+
+  def remove_body(self, body: shapes.Body | shapes.Border) -> None:
+    # bodies are swap-removed, the last body takes the place of the removed one
     if isinstance(body, shapes.Body):
-      self.kinetics.remove(body)
-    elif isinstance(body, shapes.Border):
+      if body._store is self._bodies:
+        self.remove_bodies(np.array([body._index], dtype=np.intp))
+    elif body in self.statics:
       self.statics.remove(body)
+      self._version += 1
+
+  # checkpoint format version, see save
+  CHECKPOINT_VERSION = 3
+
+  def save(self, path: str | Path) -> None:
+    # writes an uncompressed npz: the store rows, borders as parameter rows and a json config with
+    # everything else, shape classes and collision types are written as entries of a type table
+    b = self._bodies
+    table: list[Any] = []
+    index: dict[Any, int] = {}
+    def enc(t: Any) -> int:
+      if t not in index:
+        index[t] = len(table)
+        table.append(t)
+      return index[t]
+
+    # registry id -> table index, the registry itself differs between processes
+    remap = np.zeros(type_count(), dtype=np.intp)
+    for t in np.unique(np.concatenate((b.kind, b.collision_type))).tolist():
+      remap[t] = enc(type_of(t))
+    statics = np.zeros((len(self.statics), 5), dtype=DTYPE)
+    for k, stat in enumerate(self.statics):
+      if isinstance(stat, shapes.CircleBorder): statics[k] = stat.x, stat.y, stat.line_width, stat.radius, 0
+      elif isinstance(stat, shapes.RectangleBorder): statics[k] = stat.x, stat.y, stat.line_width, stat.width, stat.height
+      else: raise NotImplementedError(f'cannot save {type(stat).__name__}')
+
+    config = {
+      'version': self.CHECKPOINT_VERSION,
+      'steps': self.steps,
+      'batched': self.batched,
+      'ccd': self._ccd,
+      'dtype': self.dtype.str,
+      'broadphase': self.broadphase.config(),
+      'handlers': [(type(h).__name__, [enc(t) for t in h.types]) for h in self.collision_handlers],
+      'body_kinds': [(enc(cls), enc(ct)) for cls, ct in self._body_kinds],
+      'static_kinds': [(enc(cls), enc(ct)) for cls, ct in self._static_kinds],
+      'statics': [(enc(type(stat)), enc(stat.collision_type)) for stat in self.statics],
+      'sleep_threshold': self.sleep_threshold,
+      'sleep_steps': self.sleep_steps,
+      # whether the sleep state is still valid for this scene, otherwise the next step resets it
+      'sleep_valid': self._sleep_key == self._sleep_state_key(),
+      'woken': self._woken,
+    }
+    arrays = {name: getattr(b, name)[:b.n] for name in b.fields()}
+    arrays['_kind'] = remap[b.kind]
+    arrays['_collision_type'] = remap[b.collision_type]
+    # table entries are shape classes by name or int collision types
+    config['types'] = [t.__name__ if isinstance(t, type) else t for t in table]
+    asleep = self._asleep if self._asleep is not None else np.zeros(0, dtype=np.bool_)
+    config['asleep'] = self._asleep is not None
+    np.savez(
+      path, config=np.array(json.dumps(config)), dt=np.array(self.dt), gravity=self._gravity, asleep=asleep,
+      rest_force=self._rest_force, rest_acceleration=self._rest_acceleration,
+      static_params=statics, static_collisions=np.array([stat._collisions for stat in self.statics], dtype=np.int64),
+      **arrays,
+    )
+
+  @classmethod
+  def load(cls, path: str | Path) -> Space:
+    with np.load(path) as data:
+      config = json.loads(str(data['config']))
+      assert config['version'] == cls.CHECKPOINT_VERSION, f'unsupported checkpoint version {config["version"]}'
+      table = [getattr(shapes, t) if isinstance(t, str) else t for t in config['types']]
+      ids = np.array([type_id(t) for t in table], dtype=np.intp)
+
+      space = cls(1, config['dtype'])
+      space.dt = data['dt'][()]
+      space.gravity = data['gravity'].copy()
+      space.steps = config['steps']
+      space.batched = config['batched']
+      space._ccd = config['ccd']
+      space.broadphase = from_config(config['broadphase'])
+      handler_classes = {h.__name__: h for h in helpers.subclasses(CollisionHandler)}
+      space.collision_handlers = [handler_classes[name](tuple(table[t] for t in types)) for name, types in config['handlers']]
+      space._body_kinds = {(table[c], table[t]): None for c, t in config['body_kinds']}
+      space._static_kinds = {(table[c], table[t]): None for c, t in config['static_kinds']}
+
+      for (c, t), params, collisions in zip(config['statics'], data['static_params'], data['static_collisions'].tolist()):
+        x, y, line_width, a, h = params.tolist()
+        stat = shapes.CircleBorder(x, y, a, line_width) if table[c] is shapes.CircleBorder else shapes.RectangleBorder(x, y, a, h, line_width)
+        stat._collision_type = table[t]
+        stat._collisions = collisions
+        space.statics.append(stat)
+
+      arrays = {name: data[name] for name in BodyStore.fields()}
+      arrays['_kind'] = ids[arrays['_kind']]
+      arrays['_collision_type'] = ids[arrays['_collision_type']]
+      space._bodies.restore(arrays)
+      space._version += 1
+
+      space.sleep_threshold = config['sleep_threshold']
+      space.sleep_steps = config['sleep_steps']
+      space._woken = config['woken']
+      if config['asleep']:
+        space._asleep = data['asleep'].copy()
+        space._rest_force, space._rest_acceleration = data['rest_force'].copy(), data['rest_acceleration'].copy()
+      if config['sleep_valid']: space._sleep_key = space._sleep_state_key()
+    return space
+
+  def remove_bodies(self, rows: NDArray[np.intp]) -> None:
+    # swap-removes the bodies at the given rows of bodies in one go,
+    # like add_circles it keeps the broadphase caches, the layout and the sleep state
+    b = self._bodies
+    rows = np.unique(np.asarray(rows, dtype=np.intp))
+    sleep_valid = self._sleep_key == self._sleep_state_key()
+    holes, movers = b.remove(rows)
+    self.broadphase.removed(rows, holes, movers)
+    if sleep_valid:
+      if self._asleep is not None:
+        self._asleep[holes] = self._asleep[movers]
+        self._rest_force[holes] = self._rest_force[movers]
+        self._rest_acceleration[holes] = self._rest_acceleration[movers]
+        self._asleep, self._rest_force, self._rest_acceleration = self._asleep[:b.n], self._rest_force[:b.n], self._rest_acceleration[:b.n]
+      self._sleep_key = self._sleep_state_key()
+
+  def integrate(self, asleep: NDArray[np.bool_] | None=None) -> None:
+    b = self._bodies
+    n = b.n
+    if asleep is not None:
+      self._integrate_awake(np.flatnonzero(~asleep))
+      return
+    if len(self._vel) < b.capacity:
+      self._vel = np.empty_like(b._location)
+      self._acc = np.empty_like(b._location)
+    loc, prev = b._location[:n], b._prev_location[:n]
+    vel, acc = self._vel[:n], self._acc[:n]
+
+    # location += (location - prev_location) + (force/mass + acceleration + gravity) * dt²
+    np.subtract(loc, prev, out=vel)
+    prev[...] = loc
+    np.divide(b._force[:n], b._mass[:n, None], out=acc)
+    acc += b._acceleration[:n]
+    acc += self._gravity
+    acc *= self.dt*self.dt
+    loc += vel
+    loc += acc
+
+  def _integrate_awake(self, idx: NDArray[np.intp]) -> None:
+    # same arithmetic as integrate, on the awake rows only
+    b = self._bodies
+    loc = b._location[idx]
+    vel = loc - b._prev_location[idx]
+    acc = b._force[idx] / b._mass[idx, None]
+    acc += b._acceleration[idx]
+    acc += self._gravity if self._gravity.ndim == 1 else self._gravity[idx]
+    acc *= self.dt*self.dt
+    b._prev_location[idx] = loc
+    loc += vel
+    loc += acc
+    b._location[idx] = loc
+
+  class _Layout:
+    # per scene dispatch state: body type groups and their handlers, rebuilt only when bodies,
+    # borders, collision types or handlers change, so steps don't redo the lookups
+    def __init__(self, space: Space) -> None:
+      b = space._bodies
+      t = self.types = type_count()
+      groups = np.unique(b.kind * t + b.collision_type)
+      # (kind, collision_type) id pair -> group, -1 for pairs without one
+      self.group_of: NDArray[np.intp] = np.full(t * t, -1, dtype=np.intp)
+      self.group_of[groups] = np.arange(len(groups), dtype=np.intp)
+      self.body_ids: list[tuple[int, int]] = [divmod(g, t) for g in groups.tolist()]
+      self.regroup(b)
+      self.pair_handlers: list[list[CollisionHandler | None]] = [
+        [space.handler_for(*bx, *by) for by in self.body_ids] for bx in self.body_ids
+      ]
+      static_ids = [(type_id(type(stat)), type_id(stat.collision_type)) for stat in space.statics]
+      self.static_handlers: list[list[CollisionHandler | None]] = [
+        [space.handler_for(*bid, *sid) for sid in static_ids] for bid in self.body_ids
+      ]
+      stats = space.stats
+      if stats is not None:
+        self.pair_handlers = [[h and TimedHandler(h, stats, False) for h in row] for row in self.pair_handlers]  # type: ignore[misc]
+        self.static_handlers = [[h and TimedHandler(h, stats, True) for h in row] for row in self.static_handlers]  # type: ignore[misc]
+
+    def regroup(self, b: BodyStore) -> bool:
+      # redoes the per body arrays after rows changed, False if a body needs a group the layout doesn't have
+      group = self.group_of[b.kind * self.types + b.collision_type]
+      if (group < 0).any(): return False
+      self.body_group: NDArray[np.intp] = group
+      self.members: list[NDArray[np.intp]] = (
+        [np.flatnonzero(group == g) for g in range(len(self.body_ids))] if len(self.body_ids) > 1
+        else [np.arange(b.n, dtype=np.intp)]
+      )
+      self.store_version = b.version
+      return True
+
+  def _layout(self) -> _Layout:
+    # handlers are only looked up again if borders, handlers or the groups change,
+    # bodies coming and going just regroup
+    b = self._bodies
+    key = (self._version, len(self.collision_handlers), type_count(), id(self.stats))
+    layout = self._layout_cache
+    if layout is None or self._layout_key != key or (layout.store_version != b.version and not layout.regroup(b)):
+      layout = self._layout_cache = Space._Layout(self)
+      self._layout_key = key
+    return layout
 
   def step(self) -> None:
-    for kin in self.kinetics:
-      kin.acceleration = self.gravity
-      vel = kin.location - kin.prev_location
-      kin.prev_location = kin.location
-      kin.location = kin.location + vel + kin.acceleration * (self.dt*self.dt)
-
-    for i, kin in enumerate(self.kinetics):
-      for o_kin in self.kinetics[i+1:]:
-        handler = self.get_collision_handler(kin, o_kin)
+    if self._recorders and any(not writer.closed for writer, _ in self._recorders): self._fixed_count('record')
+    stats = self.stats
+    if stats is not None: start = perf_counter()
+    asleep = self._sleep_mask() if self.sleep_threshold is not None else None
+    # a scene that is asleep as a whole only counts the step
+    if asleep is None or not asleep.all():
+      self.integrate(asleep)
+      if stats is not None: stats.add('integrate', perf_counter() - start)
+
+      b = self._bodies
+      if stats is not None: t = perf_counter()
+      if self._ccd:
+        # bounds around the whole path of the step
+        half = (b.location - b.prev_location) * 0.5
+        first, second = all_first, all_second = self.broadphase.pairs(b.location - half, b.radius + np.sqrt(np.einsum('ij,ij->i', half, half)))
+      else:
+        first, second = all_first, all_second = self.broadphase.pairs(b.location, b.radius)
+      if asleep is not None:
+        keep = ~(asleep[first] & asleep[second])
+        first, second = first[keep], second[keep]
+        held = b.location[asleep]
+      if stats is not None:
+        stats.add('broadphase', perf_counter() - t)
+        stats.count('pairs_tested', len(first))
+        stats.count('border_tests', (b.n if asleep is None else b.n - int(asleep.sum())) * len(self.statics))
+        t = perf_counter()
+      if self.batched:
+        self._collide_batched(first, second, asleep)
+      else:
+        self._collide_sequential(first, second, asleep)
+      if self.sleep_threshold is not None:
+        self._update_sleep(all_first, all_second, asleep, held if asleep is not None else None)
+      if stats is not None: stats.add('narrow', perf_counter() - t)
+    if stats is not None:
+      stats.add('step', perf_counter() - start)
+      stats.end_step()
+
+    self.steps += 1
+    for emitter in self.emitters: emitter.emit(self)
+    for sink in self.sinks: sink.absorb(self)
+    if self._recorders: self._record()
+
+  def _sleep_mask(self) -> NDArray[np.bool_] | None:
+    # bodies asleep for this step, None if all are awake
+    b = self._bodies
+    key = self._sleep_state_key()
+    if self._sleep_key != key:
+      self._sleep_key = key
+      self._asleep = None
+      b.idle[:] = 0
+    if self._asleep is None: return None
+    pushed = np.flatnonzero(self._asleep)
+    changed = (b.force[pushed] != self._rest_force[pushed]) | (b.acceleration[pushed] != self._rest_acceleration[pushed])
+    pushed = pushed[np.any(changed, axis=1)]
+    if len(pushed):
+      self._asleep[pushed] = False
+      b.idle[pushed] = 0
+      self._woken = True
+    return self._asleep if self._asleep.any() else None
+
+  def _sleep_state_key(self) -> tuple:
+    # sleep state is only valid while bodies, borders and gravity stay the same
+    return (self._version, self._bodies.version, self._bodies.n, self._gravity.tobytes())
+
+  def _update_sleep(
+    self, first: NDArray[np.intp], second: NDArray[np.intp],
+    asleep: NDArray[np.bool_] | None, held: NDArray[DTYPE] | None,
+  ) -> None:
+    # a body is still if it moved less than the threshold this step, sleeping bodies that got pushed aren't
+    # islands are the groups of touching bodies, they fall asleep and wake up together
+    b = self._bodies
+    threshold = self.dtype.type(self.sleep_threshold)
+    moved = b.location - b.prev_location
+    still = np.einsum('ij,ij->i', moved, moved) < threshold * threshold
+    pushed = False
+    if asleep is not None:
+      sleepers = np.flatnonzero(asleep)
+      still[sleepers[np.any(b.location[sleepers] != held, axis=1)]] = False
+      pushed = bool(np.any(~still[sleepers]))
+    idle = b.idle
+    idle[still] += 1
+    idle[~still] = 0
+
+    # islands only change state if a sleeper got pushed or woken, or an awake body could fall asleep
+    ready = idle >= self.sleep_steps
+    if asleep is not None: ready &= ~asleep
+    if not (ready.any() or self._woken or pushed): return
+    self._woken = False
+
+    d = b.location[first] - b.location[second]
+    reach = b.radius[first] + b.radius[second] + threshold
+    touch = np.einsum('ij,ij->i', d, d) < reach * reach
+    graph = coo_matrix((np.ones(int(touch.sum()), dtype=np.int8), (first[touch], second[touch])), shape=(b.n, b.n))
+    count, island = connected_components(graph, directed=False)
+    island_idle = np.full(count, np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(island_idle, island, idle)
+    self._asleep = island_idle[island] >= self.sleep_steps
+    self._rest_force, self._rest_acceleration = b.force.copy(), b.acceleration.copy()
+
+  def record(self, path: str, every: int=1, radius: bool=False, collisions: bool=False) -> TrajectoryWriter:
+    # appends the current kinetic locations, and optionally radii and collision counts, to a trajectory file
+    # now and after every `every` steps until the returned writer is closed
+    b = self._bodies
+    self._fixed_count('record')
+    writer = TrajectoryWriter(path, b.n, radius, collisions, every, self.dtype)
+    writer.append(b.location, b.radius, b.collisions)
+    self._recorders.append((writer, self.steps))
+    return writer
+
+  def _fixed_count(self, what: str) -> None:
+    # trajectories and captures hold the same bodies in every frame, emitters and sinks add and remove some
+    if self.emitters or self.sinks:
+      raise ValueError(f'cannot {what} a space with emitters or sinks, they change the body count')
+
+  def _record(self) -> None:
+    b = self._bodies
+    self._recorders = [(writer, start) for writer, start in self._recorders if not writer.closed]
+    for writer, start in self._recorders:
+      if (self.steps - start) % writer.every == 0:
+        writer.append(b.location, b.radius, b.collisions)
+
+  def run(self, steps: int, callback: Callable[[Space, int], None] | None=None, every: int=1, capture: bool=False) -> NDArray[DTYPE] | None:
+    # advances steps steps, callback(space, step) and location captures only happen every `every` steps
+    # the scene layout, scratch buffers and broadphase state stay alive across the whole run
+    assert every >= 1, 'every must be >= 1'
+    if capture: self._fixed_count('capture')
+    frames = np.empty((steps // every, self._bodies.n, 2), dtype=self.dtype) if capture else None
+    step = self.step
+    done = 0
+    while done + every <= steps:
+      for _ in range(every): step()
+      done += every
+      if frames is not None:
+        assert self._bodies.n == frames.shape[1], 'body count changed during a captured run'
+        frames[done // every - 1] = self._bodies.location
+      if callback is not None: callback(self, done)
+    for _ in range(steps - done): step()
+    return frames
+
+  def _collide_statics(self, kin: shapes.Body, handlers: list[CollisionHandler | None]) -> None:
+    for stat, handler in zip(self.statics, handlers):
+      if handler is None: raise ValueError('Unkown Handler')
+
+      if handler.check(kin, stat):
+        handler.resolve(kin, stat)
+
+  def _collide_sequential(self, first: NDArray[np.intp], second: NDArray[np.intp], asleep: NDArray[np.bool_] | None=None) -> None:
+    b = self._bodies
+    layout = self._layout()
+    kinetics = b.materialize()
+    bounds = np.searchsorted(first, np.arange(b.n + 1)).tolist()
+    others = second.tolist()
+    group = layout.body_group.tolist()
+    sleeping = asleep.tolist() if asleep is not None else None
+
+    for i, kin in enumerate(kinetics):
+      handlers = layout.pair_handlers[group[i]]
+      for j in others[bounds[i]:bounds[i+1]]:
+        o_kin = kinetics[j]
+        handler = handlers[group[j]]
         if handler is None: raise ValueError('Unknown Handler')
 
         if handler.check(kin, o_kin):
           handler.resolve(kin, o_kin)
-      
-      for stat in self.statics:
-        handler = self.get_collision_handler(kin, stat)
+
+      if sleeping is None or not sleeping[i]:
+        self._collide_statics(kin, layout.static_handlers[group[i]])
+
+  def _collide_batched(self, first: NDArray[np.intp], second: NDArray[np.intp], asleep: NDArray[np.bool_] | None=None) -> None:
+    # every candidate pair is checked at once, the colliding ones are resolved in color passes
+    # where no two pairs share a body, each pass is rechecked against the positions the earlier ones left
+    b = self._bodies
+    layout = self._layout()
+    if len(first):
+      n_groups = len(layout.body_ids)
+      if n_groups == 1:
+        handlers = layout.pair_handlers[0][:1]
+        group = np.zeros(len(first), dtype=np.intp)
+      else:
+        pair_groups, group = np.unique(layout.body_group[first] * n_groups + layout.body_group[second], return_inverse=True)
+        handlers = [layout.pair_handlers[gx][gy] for gx, gy in (divmod(g, n_groups) for g in pair_groups.tolist())]
+        group = group.reshape(-1)
+      if any(handler is None for handler in handlers): raise ValueError('Unknown Handler')
+
+      hit = np.empty(len(first), dtype=np.bool_)
+      for g, handler in enumerate(handlers):
+        sel = group == g
+        hit[sel] = handler.check_batch(b, first[sel], second[sel])  # type: ignore[union-attr]
+      first, second, group = first[hit], second[hit], group[hit]
+
+      color = self._pair_colors(first, second)
+      order = np.argsort(color, kind='stable')
+      bounds = np.searchsorted(color[order], np.arange(int(color.max(initial=-1)) + 2)).tolist()
+      for c in range(len(bounds) - 1):
+        sl = order[bounds[c]:bounds[c+1]]
+        i, j, g_sl = first[sl], second[sl], group[sl]
+        for g, handler in enumerate(handlers):
+          sel = g_sl == g
+          if not sel.any(): continue
+          gi, gj = i[sel], j[sel]
+          ok = handler.check_batch(b, gi, gj)  # type: ignore[union-attr]
+          handler.resolve_batch(b, gi[ok], gj[ok])  # type: ignore[union-attr]
+
+    self._collide_statics_batched(layout, asleep)
+
+  def _pair_colors(self, first: NDArray[np.intp], second: NDArray[np.intp]) -> NDArray[np.intp]:
+    return helpers.pair_colors(first, second, self._bodies.n)
+
+  def _collide_statics_batched(self, layout: _Layout, asleep: NDArray[np.bool_] | None=None) -> None:
+    # every border is checked against all (awake) bodies of a type at once
+    b = self._bodies
+    if b.n == 0: return
+    members = layout.members if asleep is None else [idx[~asleep[idx]] for idx in layout.members]
+    for s, stat in enumerate(self.statics):
+      for g, idx in enumerate(members):
+        if len(idx) == 0: continue
+        handler = layout.static_handlers[g][s]
         if handler is None: raise ValueError('Unkown Handler')
 
-        if handler.check(kin, stat):
-          handler.resolve(kin, stat)
+        hit = handler.check_batch(b, idx, stat)
+        if hit.any():
+          handler.resolve_batch(b, idx[hit], stat)
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+from time import perf_counter
+from typing import TYPE_CHECKING, Callable
+
+import numpy as np
+from numpy.typing import NDArray
+
+if TYPE_CHECKING:
+  from verlet_simple2d.handler import CollisionHandler
+  from verlet_simple2d.store import BodyStore
+
+
+class StepStats:
+  # wall time per phase and event counters, summed over a window of steps
+  # phases: step, integrate, broadphase, narrow (all collision handling), check (body pairs),
+  #         resolve:<handler> (body pairs), borders (checks and resolves against statics)
+  # counters: pairs_tested (broadphase candidates), pairs_colliding, border_tests, border_hits, handler_lookups
+  # every `window` steps the totals move to `last` and, if given, log is called with the formatted window
+  def __init__(self, window: int=0, log: Callable[[str], None] | None=None) -> None:
+    self.window = window
+    self.log = log
+    self.steps: int = 0
+    self.times: dict[str, float] = {}
+    self.counts: dict[str, int] = {}
+    self.last: dict | None = None
+
+  def add(self, phase: str, seconds: float) -> None:
+    self.times[phase] = self.times.get(phase, 0.0) + seconds
+
+  def count(self, counter: str, k: int=1) -> None:
+    self.counts[counter] = self.counts.get(counter, 0) + k
+
+  def reset(self) -> None:
+    self.steps = 0
+    self.times = {}
+    self.counts = {}
+
+  def summary(self) -> dict:
+    return {'steps': self.steps, 'times': dict(self.times), 'counts': dict(self.counts)}
+
+  def format(self) -> str:
+    steps = max(self.steps, 1)
+    times = ', '.join(f'{phase}={1000 * t / steps:.3f}ms' for phase, t in self.times.items())
+    counts = ', '.join(f'{counter}={k / steps:.1f}' for counter, k in self.counts.items())
+    return f'{self.steps} steps, per step: {times}; {counts}'
+
+  def end_step(self) -> None:
+    self.steps += 1
+    if self.window and self.steps >= self.window:
+      self.last = self.summary()
+      if self.log is not None: self.log(self.format())
+      self.reset()
+
+class TimedHandler:
+  # stands in for a handler while stats are enabled, so the disabled path never pays for timing
+  def __init__(self, handler: CollisionHandler, stats: StepStats, border: bool) -> None:
+    self.handler = handler
+    self.types = handler.types
+    self.stats = stats
+    self._check = 'borders' if border else 'check'
+    self._resolve = 'borders' if border else f'resolve:{type(handler).__name__}'
+    self._hits = 'border_hits' if border else 'pairs_colliding'
+
+  def check(self, X, Y) -> bool:
+    t = perf_counter()
+    hit = self.handler.check(X, Y)
+    self.stats.add(self._check, perf_counter() - t)
+    return hit
+
+  def resolve(self, X, Y) -> None:
+    t = perf_counter()
+    self.handler.resolve(X, Y)
+    self.stats.add(self._resolve, perf_counter() - t)
+    self.stats.count(self._hits)
+
+  def check_batch(self, store: BodyStore, i: NDArray[np.intp], Y) -> NDArray[np.bool_]:
+    t = perf_counter()
+    hit = self.handler.check_batch(store, i, Y)
+    self.stats.add(self._check, perf_counter() - t)
+    return hit
+
+  def resolve_batch(self, store: BodyStore, i: NDArray[np.intp], Y) -> None:
+    t = perf_counter()
+    self.handler.resolve_batch(store, i, Y)
+    self.stats.add(self._resolve, perf_counter() - t)
+    self.stats.count(self._hits, len(i))
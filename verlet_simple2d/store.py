@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+from numpy.typing import ArrayLike, NDArray
+
+from verlet_simple2d import DTYPE
+
+if TYPE_CHECKING:
+  from verlet_simple2d.shapes import Body
+
+
+# collision types are either shape classes or user set ints, both get mapped to a small int id
+# the shape class of a body (its kind) is registered the same way
+_TYPE_IDS: dict[Any, int] = {}
+_TYPES: list[Any] = []
+
+def type_id(collision_type: Any) -> int:
+  tid = _TYPE_IDS.get(collision_type)
+  if tid is None:
+    tid = _TYPE_IDS[collision_type] = len(_TYPES)
+    _TYPES.append(collision_type)
+  return tid
+
+def type_of(tid: int) -> Any:
+  return _TYPES[tid]
+
+def type_count() -> int:
+  return len(_TYPES)
+
+
+class BodyStore:
+  # all kinetic state lives in contiguous arrays, bodies are handles (store, index) into them
+  # arrays are over-allocated, only the first n rows are valid
+  # growing reallocates, so views taken before an append may go stale
+  def __init__(self, capacity: int=16, dtype=DTYPE) -> None:
+    # float type of every kinetic array
+    self.dtype = np.dtype(dtype)
+    self.n: int = 0
+    # bumped on every change to the set of bodies or their collision types
+    self.version: int = 0
+    # None for rows added in bulk without handles, materialize() fills them in
+    self.handles: list[Body | None] = []
+    self._lazy: int = 0
+    self._alloc(max(capacity, 1))
+
+  def _alloc(self, capacity: int) -> None:
+    n = self.n
+    old = {name: getattr(self, name) for name in self.fields()} if n else {}
+    self._location: NDArray[DTYPE] = np.zeros((capacity, 2), dtype=self.dtype)
+    self._prev_location: NDArray[DTYPE] = np.zeros((capacity, 2), dtype=self.dtype)
+    self._acceleration: NDArray[DTYPE] = np.zeros((capacity, 2), dtype=self.dtype)
+    self._force: NDArray[DTYPE] = np.zeros((capacity, 2), dtype=self.dtype)
+    self._radius: NDArray[DTYPE] = np.zeros(capacity, dtype=self.dtype)
+    self._mass: NDArray[DTYPE] = np.ones(capacity, dtype=self.dtype)
+    self._collision_type: NDArray[np.intp] = np.zeros(capacity, dtype=np.intp)
+    self._kind: NDArray[np.intp] = np.zeros(capacity, dtype=np.intp)
+    self._collisions: NDArray[np.int64] = np.zeros(capacity, dtype=np.int64)
+    # consecutive steps the body moved less than Space.sleep_threshold
+    self._idle: NDArray[np.int64] = np.zeros(capacity, dtype=np.int64)
+    if n:
+      for name in self.fields():
+        getattr(self, name)[:n] = old[name][:n]
+
+  @staticmethod
+  def fields() -> tuple[str, ...]:
+    return ('_location', '_prev_location', '_acceleration', '_force', '_radius', '_mass', '_collision_type', '_kind', '_collisions', '_idle')
+
+  @property
+  def capacity(self) -> int:
+    return len(self._location)
+
+  def reserve(self, capacity: int) -> None:
+    if capacity > self.capacity:
+      self._alloc(max(capacity, 2 * self.capacity))
+
+  @property
+  def location(self) -> NDArray[DTYPE]:
+    return self._location[:self.n]
+
+  @property
+  def prev_location(self) -> NDArray[DTYPE]:
+    return self._prev_location[:self.n]
+
+  @property
+  def acceleration(self) -> NDArray[DTYPE]:
+    return self._acceleration[:self.n]
+
+  @property
+  def force(self) -> NDArray[DTYPE]:
+    return self._force[:self.n]
+
+  @property
+  def radius(self) -> NDArray[DTYPE]:
+    return self._radius[:self.n]
+
+  @property
+  def mass(self) -> NDArray[DTYPE]:
+    return self._mass[:self.n]
+
+  @property
+  def collision_type(self) -> NDArray[np.intp]:
+    return self._collision_type[:self.n]
+
+  @property
+  def kind(self) -> NDArray[np.intp]:
+    return self._kind[:self.n]
+
+  @property
+  def collisions(self) -> NDArray[np.int64]:
+    return self._collisions[:self.n]
+
+  @property
+  def idle(self) -> NDArray[np.int64]:
+    return self._idle[:self.n]
+
+  def handle(self, i: int) -> Body:
+    body = self.handles[i]
+    if body is None:
+      cls = type_of(int(self._kind[i]))
+      body = self.handles[i] = cls.__new__(cls)
+      body._store, body._index = self, i
+      self._lazy -= 1
+    return body
+
+  def materialize(self) -> list[Body]:
+    # the handles of all rows, creating the missing ones
+    if self._lazy:
+      for i in [i for i, body in enumerate(self.handles) if body is None]:
+        self.handle(i)
+    return self.handles  # type: ignore[return-value]
+
+  def extend(
+    self, location: ArrayLike, prev_location: ArrayLike, radius: ArrayLike, mass: ArrayLike,
+    kind: int, collision_type: ArrayLike,
+  ) -> int:
+    # appends len(location) rows at once without handles, returns the index of the first one
+    # every argument but location broadcasts, so a single value can stand for all rows
+    location = np.asarray(location)
+    k = len(location)
+    start = self.n
+    self.reserve(start + k)
+    end = start + k
+    self._location[start:end] = location
+    self._prev_location[start:end] = prev_location
+    self._acceleration[start:end] = 0
+    self._force[start:end] = 0
+    self._radius[start:end] = radius
+    self._mass[start:end] = mass
+    self._kind[start:end] = kind
+    self._collision_type[start:end] = collision_type
+    self._collisions[start:end] = 0
+    self._idle[start:end] = 0
+    self.handles.extend([None] * k)
+    self._lazy += k
+    self.n = end
+    self.version += 1
+    return start
+
+  def restore(self, arrays: dict[str, NDArray]) -> None:
+    # replaces all rows with the given field arrays (keyed like fields()), handles are created on demand
+    n = len(arrays['_location'])
+    self.n = 0
+    self.reserve(n)
+    for name in self.fields():
+      getattr(self, name)[:n] = arrays[name]
+    self.n = n
+    self.handles = [None] * n
+    self._lazy = n
+    self.version += 1
+
+  def adopt(self, body: Body) -> None:
+    # moves the state of a standalone body into this store and rebinds the handle
+    # a body of another store has to be removed there first, so that store's owner sees it go
+    if body._store is not LOOSE: raise ValueError('body belongs to another Space, remove it from there first')
+    j = body._index
+    self.reserve(self.n + 1)
+    i = self.n
+    for name in self.fields():
+      getattr(self, name)[i] = getattr(LOOSE, name)[j]
+    self.handles.append(body)
+    self.n += 1
+    self.version += 1
+    body._store, body._index = self, i
+    LOOSE.give(j)
+
+  def remove(self, rows: NDArray[np.intp]) -> tuple[NDArray[np.intp], NDArray[np.intp]]:
+    # swap-remove: the surviving last rows move into the holes, so only len(rows) rows get copied
+    # and the order of the remaining rows changes, handles of removed rows keep their state in LOOSE
+    # returns (holes, movers), the row movers[k] now sits at holes[k]
+    rows = np.unique(rows)
+    n, k = self.n, len(rows)
+    if k == 0: return rows, rows
+    for i in rows.tolist():
+      body = self.handles[i]
+      if body is None:
+        self._lazy -= 1
+        continue
+      body._store, body._index = LOOSE, LOOSE.take_from(self, i)
+
+    end = n - k
+    holes = rows[rows < end]
+    tail = np.arange(end, n, dtype=np.intp)
+    movers = tail[~np.isin(tail, rows)]
+    for name in self.fields():
+      arr = getattr(self, name)
+      arr[holes] = arr[movers]
+    for hole, mover in zip(holes.tolist(), movers.tolist()):
+      body = self.handles[hole] = self.handles[mover]
+      if body is not None: body._index = hole
+    del self.handles[end:]
+    self.n = end
+    self.version += 1
+    return holes, movers
+
+class LooseStore(BodyStore):
+  # the one store of every body outside of a Space, so a standalone body costs a row instead of a whole store
+  # rows never move, a row is reused once its body got adopted by a Space or garbage collected
+  # it holds no references to its bodies, handles stays empty
+  def __init__(self) -> None:
+    super().__init__(64)
+    self._free: list[int] = []
+
+  def _row(self) -> int:
+    if self._free: return self._free.pop()
+    self.reserve(self.n + 1)
+    self.n += 1
+    return self.n - 1
+
+  def take(self, kind: int, x: float, y: float) -> int:
+    # a fresh row for a new body at (x, y)
+    i = self._row()
+    self._location[i] = self._prev_location[i] = x, y
+    self._acceleration[i] = self._force[i] = 0
+    self._radius[i] = 0
+    self._mass[i] = 1
+    self._collision_type[i] = self._kind[i] = kind
+    self._collisions[i] = self._idle[i] = 0
+    return i
+
+  def take_from(self, src: BodyStore, j: int) -> int:
+    # a copy of row j of src
+    i = self._row()
+    for name in self.fields():
+      getattr(self, name)[i] = getattr(src, name)[j]
+    return i
+
+  def give(self, i: int) -> None:
+    self._free.append(i)
+    if len(self._free) == self.n:
+      # every row came back, start over small
+      self._free.clear()
+      self.n = 0
+      if self.capacity > 1024: self._alloc(64)
+
+LOOSE: LooseStore = LooseStore()
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import itertools
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Iterable, Iterator, NamedTuple
+
+import numpy as np
+from numpy.typing import NDArray
+
+from verlet_simple2d import DTYPE
+from verlet_simple2d.space import Space
+
+# builds a fresh scene from one parameter set, has to be a module level function so workers can unpickle it
+SceneBuilder = Callable[..., Space]
+
+
+class RunResult(NamedTuple):
+  # what a run sends back instead of its space, run is the position of its parameters in params
+  run: int
+  params: dict[str, Any]
+  steps: int
+  collisions: float
+  energy_start: float
+  energy_end: float
+  location: NDArray[DTYPE]
+  seconds: float
+
+  @property
+  def energy_drift(self) -> float:
+    # relative change of the total energy over the run
+    return (self.energy_end - self.energy_start) / abs(self.energy_start) if self.energy_start else self.energy_end - self.energy_start
+
+def grid(**axes: Iterable) -> list[dict[str, Any]]:
+  # every combination of the given parameter values, grid(dt=[a, b], count=[c]) -> [{dt: a, count: c}, {dt: b, count: c}]
+  names = list(axes)
+  return [dict(zip(names, values)) for values in itertools.product(*(list(v) for v in axes.values()))]
+
+def energy(space: Space) -> float:
+  # kinetic energy from the verlet velocity plus potential energy in the space's gravity field
+  b = space.bodies
+  vel = (b.location - b.prev_location) / space.dt
+  kinetic = 0.5 * np.sum(b.mass * np.einsum('ij,ij->i', vel, vel))
+  gravity = np.broadcast_to(space.gravity, b.location.shape)
+  potential = -np.sum(b.mass * np.einsum('ij,ij->i', b.location, gravity))
+  return float(kinetic + potential)
+
+def collisions(space: Space) -> float:
+  # every collision is counted on both sides, same total backwards.py prints
+  return (int(space.bodies.collisions.sum()) + sum(stat._collisions for stat in space.statics)) / 2
+
+def run_one(build: SceneBuilder, run: int, params: dict[str, Any], steps: int) -> RunResult:
+  start = time.perf_counter()
+  space = build(**params)
+  energy_start = energy(space)
+  space.run(steps)
+  return RunResult(
+    run, params, steps, collisions(space), energy_start, energy(space),
+    space.bodies.location.copy(), time.perf_counter() - start,
+  )
+
+def sweep(build: SceneBuilder, params: list[dict[str, Any]], steps: int, workers: int=0) -> Iterator[RunResult]:
+  # runs build(**p) for steps steps for every p in params, yields the results as the runs finish
+  # workers > 0 fans the runs out over a process pool, only parameters and results cross processes
+  if workers <= 0:
+    for run, p in enumerate(params):
+      yield run_one(build, run, p, steps)
+    return
+
+  with ProcessPoolExecutor(workers) as pool:
+    futures = [pool.submit(run_one, build, run, p, steps) for run, p in enumerate(params)]
+    for future in as_completed(futures):
+      yield future.result()
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+from numpy.typing import NDArray
+
+from verlet_simple2d import DTYPE
+
+# file layout: a 64 byte header followed by fixed size frames
+#   header: magic, version, dtype char, flags, body count, step interval
+#   frame:  location (n, 2), radius (n,) if FLAG_RADIUS, collisions (n,) int64 if FLAG_COLLISIONS
+MAGIC = b'VS2DTRAJ'
+VERSION = 1
+HEADER_SIZE = 64
+FLAG_RADIUS = 1
+FLAG_COLLISIONS = 2
+
+_HEADER = np.dtype([
+  ('magic', 'S8'),
+  ('version', '<u4'),
+  ('dtype', 'S4'),
+  ('flags', '<u4'),
+  ('n', '<u8'),
+  ('every', '<u8'),
+])
+
+
+def frame_dtype(n: int, dtype, flags: int) -> np.dtype:
+  fields: list[tuple] = [('location', np.dtype(dtype).newbyteorder('<'), (n, 2))]
+  if flags & FLAG_RADIUS: fields.append(('radius', np.dtype(dtype).newbyteorder('<'), (n,)))
+  if flags & FLAG_COLLISIONS: fields.append(('collisions', '<i8', (n,)))
+  return np.dtype(fields)
+
+class TrajectoryWriter:
+  # appends one frame at a time, every frame is flushed so Trajectory can read the file while it's written
+  def __init__(self, path: str | Path, n: int, radius: bool=False, collisions: bool=False, every: int=1, dtype=DTYPE) -> None:
+    assert every >= 1, 'every must be >= 1'
+    self.path = Path(path)
+    self.n = n
+    self.every = every
+    self.flags = (FLAG_RADIUS if radius else 0) | (FLAG_COLLISIONS if collisions else 0)
+    self.frame_dtype = frame_dtype(n, dtype, self.flags)
+    self.frames = 0
+
+    header = np.zeros(1, dtype=_HEADER)
+    header['magic'] = MAGIC
+    header['version'] = VERSION
+    header['dtype'] = np.dtype(dtype).str.encode()
+    header['flags'] = self.flags
+    header['n'] = n
+    header['every'] = every
+    self._file = open(self.path, 'wb')
+    self._file.write(header.tobytes().ljust(HEADER_SIZE, b'\0'))
+    self._file.flush()
+    self._frame = np.zeros(1, dtype=self.frame_dtype)
+
+  @property
+  def closed(self) -> bool:
+    return self._file.closed
+
+  def append(self, location: NDArray, radius: NDArray | None=None, collisions: NDArray | None=None) -> None:
+    assert len(location) == self.n, f'trajectory records {self.n} bodies, got {len(location)}'
+    frame = self._frame[0]
+    frame['location'] = location
+    if self.flags & FLAG_RADIUS: frame['radius'] = radius
+    if self.flags & FLAG_COLLISIONS: frame['collisions'] = collisions
+    self._file.write(self._frame.tobytes())
+    self._file.flush()
+    self.frames += 1
+
+  def flush(self) -> None:
+    self._file.flush()
+
+  def close(self) -> None:
+    self._file.close()
+
+  def __enter__(self) -> TrajectoryWriter:
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback) -> None:
+    self.close()
+
+class Trajectory:
+  # read only, memory mapped view of a trajectory file, every accessor returns views into the map
+  def __init__(self, path: str | Path) -> None:
+    self.path = Path(path)
+    header = np.fromfile(self.path, dtype=_HEADER, count=1)
+    if len(header) == 0 or header['magic'][0] != MAGIC: raise ValueError(f'{self.path} is not a trajectory file')
+    if header['version'][0] != VERSION: raise ValueError(f'unsupported trajectory version {header["version"][0]}')
+    self.n = int(header['n'][0])
+    self.every = int(header['every'][0])
+    self.flags = int(header['flags'][0])
+    self.dtype = np.dtype(header['dtype'][0].decode())
+    self.frame_dtype = frame_dtype(self.n, self.dtype, self.flags)
+
+    # a partially written last frame is ignored
+    count = (self.path.stat().st_size - HEADER_SIZE) // self.frame_dtype.itemsize
+    self._frames = np.memmap(self.path, dtype=self.frame_dtype, mode='r', offset=HEADER_SIZE, shape=(count,)) if count else np.zeros(0, dtype=self.frame_dtype)
+
+  def __len__(self) -> int:
+    return len(self._frames)
+
+  @property
+  def location(self) -> NDArray:
+    return self._frames['location']
+
+  @property
+  def radius(self) -> NDArray | None:
+    return self._frames['radius'] if self.flags & FLAG_RADIUS else None
+
+  @property
+  def collisions(self) -> NDArray | None:
+    return self._frames['collisions'] if self.flags & FLAG_COLLISIONS else None
+
+  def frames(self, start: int=0, stop: int | None=None) -> NDArray:
+    return self.location[start:stop]